@@ -1,22 +1,78 @@
 import json
-import os
-from config import CURRENT_SEM_JSON,ALL_COURSES_CLIPS_JSON, SLIDES_OUTPUT_DIR
+from bisect import bisect_left, bisect_right
+from config import CURRENT_SEM_JSON,ALL_COURSES_CLIPS_JSON
+from content_store import get_updated_content_file, iter_updated_content, updated_content_exists
 from datetime import datetime, timezone
 
 def load_all_clips():
     with open(ALL_COURSES_CLIPS_JSON, "r") as f:
         return json.load(f)
 
-def update_current_sem():
-    TIME_WINDOW_MS = 24 * 60 * 60 * 1000  # 24 hours in milliseconds
+TIME_WINDOW_MS = 24 * 60 * 60 * 1000  # 24 hours in milliseconds
 
+
+def get_last_valid_slide(clip_data):
+    """Return the (sectionUri, slideUri) of the last matched entry of a clip."""
+    last_valid_sectionUri = ""
+    last_valid_slideUri = ""
+    for ts in sorted(clip_data.keys(), key=lambda x: float(x)):
+        sectionUri = clip_data[ts].get('sectionUri', '')
+        slideUri = clip_data[ts].get('slideUri', '')
+        if sectionUri:
+            last_valid_sectionUri = sectionUri
+            last_valid_slideUri = slideUri
+    return last_valid_sectionUri, last_valid_slideUri
+
+
+def load_last_valid_slides(course_id, semester_keys):
+    """Map each extracted clip of a course to (semester index, section, slide).
+
+    Reads every semester's updated file once; a later semester wins if a
+    clip id appears in several.
+    """
+    last_valid_slides = {}
+    for semester_idx, semester_key in enumerate(semester_keys):
+        print(f"  Semester: {semester_key}")
+
+        if not updated_content_exists(course_id, semester_key):
+            extracted_file_path = get_updated_content_file(course_id, semester_key)
+            print(f"  WARNING: {extracted_file_path} not found. Skipping.")
+            continue
+
+        # Keep only each clip's last matched slide, not its entries.
+        for clip_id, clip in iter_updated_content(course_id, semester_key):
+            last_valid_slides[clip_id] = (semester_idx, *get_last_valid_slide(clip['extracted_content']))
+    return last_valid_slides
+
+
+def find_nearest_clip(course_clips, recorded_timestamps, timestamp_ms):
+    """Return (clip_id, signed diff) of the recording closest to timestamp_ms."""
+    nearest = None
+    idx = bisect_left(recorded_timestamps, timestamp_ms)
+    for neighbour_idx in (idx - 1, idx):
+        if not 0 <= neighbour_idx < len(course_clips):
+            continue
+        # The first clip recorded at that time, as a linear scan would pick.
+        first_idx = bisect_left(recorded_timestamps, recorded_timestamps[neighbour_idx])
+        recorded_ts, original_idx, clip_id = course_clips[first_idx]
+        candidate = (abs(timestamp_ms - recorded_ts), original_idx, clip_id, timestamp_ms - recorded_ts)
+        if nearest is None or candidate < nearest:
+            nearest = candidate
+    if nearest is None:
+        return None, None
+    return nearest[2], nearest[3]
+
+
+def update_current_sem(all_clips=None):
     with open(CURRENT_SEM_JSON, 'r') as f:
         current_sem = json.load(f)
         print(f"Loaded {len(current_sem)} courses from {CURRENT_SEM_JSON}")
 
-    all_clips = load_all_clips()
+    if all_clips is None:
+        all_clips = load_all_clips()
 
-    
+    # Per course: (recording timestamp, position in the clip list, clip id),
+    # sorted by timestamp so the clips of a time window can be bisected.
     clip_timestamp_map = {}
     for course_id, semester_map in all_clips.items():
         timestamps = []
@@ -33,7 +89,12 @@ def update_current_sem():
                     continue
                 recording_ts = int(recording_dt.timestamp() * 1000)
                 timestamps.append((recording_ts, clip["clip_id"]))
-        clip_timestamp_map[course_id] = timestamps
+        if course_id in {"ai-1", "ai-2"}:
+            timestamps = timestamps[1:]
+        clip_timestamp_map[course_id] = sorted(
+            (recording_ts, original_idx, clip_id)
+            for original_idx, (recording_ts, clip_id) in enumerate(timestamps)
+        )
 
     for course_id, course_entries in current_sem.items():
         print(f"\nProcessing course: {course_id}")
@@ -42,74 +103,51 @@ def update_current_sem():
             print(f"Skipping {course_id}, not found in all_clips.")
             continue
 
-        for semester_key in all_clips[course_id]:
-            print(f"  Semester: {semester_key}")
-
-            extracted_file_path = os.path.join(
-                SLIDES_OUTPUT_DIR,
-                f"{course_id}_{semester_key}_updated_extracted_content.json"
-             )
-
-            if not os.path.exists(extracted_file_path):
-                print(f"  WARNING: {extracted_file_path} not found. Skipping.")
+        semester_keys = list(all_clips[course_id])
+        last_valid_slides = load_last_valid_slides(course_id, semester_keys)
+        course_clips = clip_timestamp_map.get(course_id, [])
+        recorded_timestamps = [recorded_ts for recorded_ts, _, _ in course_clips]
+
+        matched_count = 0
+        for entry in course_entries:
+            raw_ts = entry['timestamp_ms']
+            timestamp_ms = raw_ts if raw_ts > 1e12 else raw_ts * 1000
+
+            # Clips recorded at most TIME_WINDOW_MS before the entry. The
+            # latest semester with such a clip wins, then the closest clip.
+            best = None
+            window_start = bisect_left(recorded_timestamps, timestamp_ms - TIME_WINDOW_MS)
+            window_end = bisect_right(recorded_timestamps, timestamp_ms)
+            for recorded_ts, original_idx, clip_id in course_clips[window_start:window_end]:
+                print("        ✅ Within 24h window! Clip Id:",clip_id)
+                last_valid_slide = last_valid_slides.get(str(clip_id))
+                if last_valid_slide is None:
+                    continue
+                candidate = (-last_valid_slide[0], timestamp_ms - recorded_ts, original_idx, str(clip_id))
+                if best is None or candidate < best:
+                    best = candidate
+
+            if best is None:
+                nearest_clip_id, nearest_signed_diff = find_nearest_clip(
+                    course_clips, recorded_timestamps, timestamp_ms
+                )
+                if nearest_clip_id is None:
+                    print("❌ No match (no clips recorded for this course)")
+                    continue
+                direction = "after" if nearest_signed_diff > 0 else "before"
+                print(f"❌ No match (closest clip={nearest_clip_id}, Δ={abs(nearest_signed_diff) / (1000*60*60):.2f}h {direction})")
                 continue
 
-            with open(extracted_file_path, 'r', encoding='utf-8') as ef:
-                extracted_content = json.load(ef)
-
-            matched_count = 0
-            course_clips = clip_timestamp_map.get(course_id, [])
-            if course_id in {"ai-1", "ai-2"}:
-                course_clips = course_clips[1:]
-
-            for entry in course_entries:
-                raw_ts = entry['timestamp_ms']
-                timestamp_ms = raw_ts if raw_ts > 1e12 else raw_ts * 1000
-           
-                matched_clip_id = None
-                closest_diff = TIME_WINDOW_MS + 1
-                nearest_diff = float("inf")
-                nearest_clip_id = None
-                nearest_signed_diff = None
-                for recorded_ts, clip_id in course_clips:
-                    diff = timestamp_ms - recorded_ts
-                    abs_diff = abs(diff)
-                    if abs_diff < nearest_diff:
-                            nearest_diff = abs_diff
-                            nearest_clip_id = clip_id
-                            nearest_signed_diff=diff
-
-                    if 0 <= diff <= TIME_WINDOW_MS:
-                        print("        ✅ Within 24h window! Clip Id:",clip_id)
-                        if str(clip_id) in extracted_content and diff < closest_diff:
-                            matched_clip_id = str(clip_id)
-                            closest_diff = diff
-
-                if matched_clip_id:
-                    print(f"✅ Matched clip {matched_clip_id} (Δ={closest_diff / (1000*60*60):.2f}h)")
-                else:
-                    direction = "after" if nearest_signed_diff > 0 else "before"
-                    print(f"❌ No match (closest clip={nearest_clip_id}, Δ={nearest_diff / (1000*60*60):.2f}h {direction})")                
-                    continue
+            _, closest_diff, _, matched_clip_id = best
+            print(f"✅ Matched clip {matched_clip_id} (Δ={closest_diff / (1000*60*60):.2f}h)")
+            _, last_valid_sectionUri, last_valid_slideUri = last_valid_slides[matched_clip_id]
+            entry['autoDetected'] = {
+                "clipId": matched_clip_id,
+                "sectionUri": last_valid_sectionUri,
+                "slideUri": last_valid_slideUri
+            }
 
-                clip_data = extracted_content[matched_clip_id]['extracted_content']
-                last_valid_sectionUri = ""
-                last_valid_slideUri = ""
-          
-                for ts in sorted(clip_data.keys(), key=lambda x: float(x)):
-                    sectionUri = clip_data[ts].get('sectionUri', '')
-                    slideUri = clip_data[ts].get('slideUri', '')
-                    if sectionUri:
-                        last_valid_sectionUri = sectionUri
-                        last_valid_slideUri = slideUri
-
-                entry['autoDetected'] = {
-                    "clipId": matched_clip_id,
-                    "sectionUri": last_valid_sectionUri,
-                    "slideUri": last_valid_slideUri
-                }
-
-                matched_count += 1
+            matched_count += 1
 
         print(f"Updated {matched_count}/{len(course_entries)} entries for {course_id}")
 
@@ -118,8 +156,8 @@ def update_current_sem():
 
     print(f"\n{CURRENT_SEM_JSON} successfully updated!")
 
-def main():
-    update_current_sem()
+def main(all_clips=None):
+    update_current_sem(all_clips)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,58 @@
+import os
+import json
+import time
+from config import COURSE_IDS, SLIDES_OUTPUT_DIR
+from slide_fetcher import (
+    clean_text,
+    html_to_text_bs4,
+    html_to_text_lxml,
+    lxml,
+    remove_last_line_if_frame,
+)
+
+
+def extract_slide_contents(extractor, htmls):
+    return [clean_text(remove_last_line_if_frame(extractor(html))) for html in htmls]
+
+
+def benchmark_course(course_id):
+    slides_file = os.path.join(SLIDES_OUTPUT_DIR, f"{course_id}_slides.json")
+    if not os.path.exists(slides_file):
+        print(f"[WARN] File not found: {slides_file}")
+        return
+    with open(slides_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    htmls = [
+        slide.get("html", "")
+        for section in data.get("sections", {}).values()
+        for slide in section.get("slides", [])
+    ]
+
+    start = time.perf_counter()
+    reference = extract_slide_contents(html_to_text_bs4, htmls)
+    bs4_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast = extract_slide_contents(html_to_text_lxml, htmls)
+    lxml_time = time.perf_counter() - start
+
+    mismatches = [idx for idx, (a, b) in enumerate(zip(reference, fast)) if a != b]
+    print(
+        f"{course_id}: {len(htmls)} slides, bs4 {bs4_time:.2f}s, lxml {lxml_time:.2f}s "
+        f"({bs4_time / max(lxml_time, 1e-9):.1f}x), {len(mismatches)} mismatching slides"
+    )
+    for idx in mismatches[:3]:
+        print(f"  bs4:  {reference[idx][:200]}")
+        print(f"  lxml: {fast[idx][:200]}")
+
+
+def main():
+    if lxml is None:
+        print("lxml is not installed; nothing to compare against.")
+        return
+    for course_id in COURSE_IDS:
+        benchmark_course(course_id)
+
+
+if __name__ == "__main__":
+    main()
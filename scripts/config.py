@@ -13,12 +13,53 @@ COURSE_IDS = os.getenv("COURSE_IDS", "").split(",")
 FAU_TV_COURSE_IDS = json.loads(os.getenv("FAU_TV_COURSE_IDS", "{}"))
 CURRENT_SEM_JSON = os.getenv("CURRENT_SEM_JSON", "current-sem.json")
 FRAME_PROCESSING_SLEEP_TIME = float(os.getenv("FRAME_PROCESSING_SLEEP_TIME", "0.1"))
+FRAME_SAMPLING_MODE = os.getenv("FRAME_SAMPLING_MODE", "seek")
+FRAME_SEEK_GRAB_SECONDS = float(os.getenv("FRAME_SEEK_GRAB_SECONDS", "2"))
+FRAME_DIFF_MODE = os.getenv("FRAME_DIFF_MODE", "thumbnail")
+FRAME_DIFF_THRESHOLD = float(os.getenv("FRAME_DIFF_THRESHOLD", "2.0"))
+FRAME_DIFF_THUMBNAIL_WIDTH = int(os.getenv("FRAME_DIFF_THUMBNAIL_WIDTH", "256"))
+FRAME_DHASH_SIZE = int(os.getenv("FRAME_DHASH_SIZE", "32"))
+FRAME_DHASH_THRESHOLD = float(os.getenv("FRAME_DHASH_THRESHOLD", "0.003"))
+SLIDE_REGION = [float(v) for v in os.getenv("SLIDE_REGION", "").split(",") if v.strip()]
+FRAME_CHANGE_PRECISION = float(os.getenv("FRAME_CHANGE_PRECISION", "0.5"))
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto")
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "1"))
+OCR_THREADS = int(os.getenv("OCR_THREADS", "1"))
+VIDEO_SOURCE_MODE = os.getenv("VIDEO_SOURCE_MODE", "download")
+VIDEO_VALIDATION_MODE = os.getenv("VIDEO_VALIDATION_MODE", "fast")
+VIDEO_VALIDATION_SAMPLES = int(os.getenv("VIDEO_VALIDATION_SAMPLES", "5"))
+DOWNLOAD_CHUNK_SIZE_MB = float(os.getenv("DOWNLOAD_CHUNK_SIZE_MB", "16"))
+DOWNLOAD_CHUNK_WORKERS = int(os.getenv("DOWNLOAD_CHUNK_WORKERS", "4"))
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "5"))
+METADATA_REQUESTS_PER_MINUTE = float(os.getenv("METADATA_REQUESTS_PER_MINUTE", "10"))
+METADATA_BURST = int(os.getenv("METADATA_BURST", "1"))
+METADATA_WORKERS = int(os.getenv("METADATA_WORKERS", "2"))
+METADATA_PREFETCH = int(os.getenv("METADATA_PREFETCH", "5"))
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "1"))
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "1"))
+SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", "1"))
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+PROCESS_START_METHOD = os.getenv("PROCESS_START_METHOD", "forkserver")
+LINK_CLIPS_ON_EXTRACT = os.getenv("LINK_CLIPS_ON_EXTRACT", "true").lower() in ("1", "true", "yes")
+LINK_CLIPS_BATCH_SIZE = int(os.getenv("LINK_CLIPS_BATCH_SIZE", "10"))
 OCR_EXTRACTED_FILE_PATH = os.getenv("OCR_EXTRACTED_FILE_PATH", "data/cache/")
 RESULTS_FILE_PATH = os.getenv("RESULTS_FILE_PATH", "data/results/ocr_results.json")
 SLIDES_EXPIRY_DAYS = int(os.getenv("SLIDES_EXPIRY_DAYS", 1))
 SLIDES_OUTPUT_DIR = os.getenv("SLIDES_OUTPUT_DIR", "data/slides/")
+SLIDE_FETCH_WORKERS = int(os.getenv("SLIDE_FETCH_WORKERS", "8"))
+SLIDE_PROCESS_WORKERS = int(os.getenv("SLIDE_PROCESS_WORKERS", "1"))
+HTML_TEXT_EXTRACTOR = os.getenv("HTML_TEXT_EXTRACTOR", "lxml")
 VIDEO_DOWNLOAD_DIR = os.getenv("VIDEO_DOWNLOAD_DIR", "data/videos/")
+SLIDE_MATCH_CANDIDATES = int(os.getenv("SLIDE_MATCH_CANDIDATES", "25"))
+SLIDE_MATCH_MODE = os.getenv("SLIDE_MATCH_MODE", "index")
+UPDATED_CONTENT_FORMAT = os.getenv("UPDATED_CONTENT_FORMAT", "json")
 ALL_COURSES_CLIPS_JSON = os.getenv("ALL_COURSES_CLIPS_JSON", "data/cache/all_courses_clips.json")
+CLIP_INFO_CACHE_FILE = os.getenv("CLIP_INFO_CACHE_FILE", os.path.join(OCR_EXTRACTED_FILE_PATH, "clip_info_cache.json"))
+CLIP_INFO_TTL_HOURS = float(os.getenv("CLIP_INFO_TTL_HOURS", "24"))
+CLIP_INFO_NEGATIVE_TTL_HOURS = float(os.getenv("CLIP_INFO_NEGATIVE_TTL_HOURS", "6"))
+
+if DOWNLOAD_CHUNK_SIZE_MB <= 0:
+    raise ValueError(f"DOWNLOAD_CHUNK_SIZE_MB must be positive, got {DOWNLOAD_CHUNK_SIZE_MB}")
 
 os.makedirs(OCR_EXTRACTED_FILE_PATH, exist_ok=True)
 os.makedirs(VIDEO_DOWNLOAD_DIR, exist_ok=True)
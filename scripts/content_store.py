@@ -0,0 +1,208 @@
+import os
+import json
+import sqlite3
+from config import SLIDES_OUTPUT_DIR, UPDATED_CONTENT_FORMAT
+from result_store import JsonObjectWriter, iter_json_object
+
+# Entry keys that describe the matched slide, and the slides table column
+# each one is stored in.
+SLIDE_COLUMNS = [
+    ("sectionId", "section_id"),
+    ("sectionUri", "section_uri"),
+    ("sectionTitle", "section_title"),
+    ("slideUri", "slide_uri"),
+    ("slideContent", "slide_content"),
+    ("slideHtml", "slide_html"),
+]
+ENTRY_COLUMNS = ["start_time", "end_time", "ocr_slide_content", "duration"]
+
+# Columns are declared without a type so SQLite keeps ints and floats as
+# they were written, and a reloaded file compares equal to the saved one.
+SQLITE_SCHEMA = f"""
+CREATE TABLE slides (
+    id INTEGER PRIMARY KEY,
+    {", ".join(column for _, column in SLIDE_COLUMNS)}
+);
+CREATE TABLE clips (
+    clip_id TEXT PRIMARY KEY,
+    position INTEGER,
+    duration,
+    extra TEXT
+);
+CREATE TABLE entries (
+    clip_id TEXT,
+    ts TEXT,
+    position INTEGER,
+    {", ".join(ENTRY_COLUMNS)},
+    slide_id INTEGER REFERENCES slides (id),
+    extra TEXT,
+    PRIMARY KEY (clip_id, ts)
+);
+"""
+
+
+def get_updated_content_file(course_id, semester_key, storage_format=None):
+    storage_format = storage_format or UPDATED_CONTENT_FORMAT
+    extension = "sqlite" if storage_format == "sqlite" else "json"
+    return os.path.join(
+        SLIDES_OUTPUT_DIR, f"{course_id}_{semester_key}_updated_extracted_content.{extension}"
+    )
+
+
+def updated_content_exists(course_id, semester_key):
+    return any(
+        os.path.exists(get_updated_content_file(course_id, semester_key, storage_format))
+        for storage_format in ("sqlite", "json")
+    )
+
+
+def iter_updated_content(course_id, semester_key):
+    """Yield the (clip_id, clip_data) pairs of the matched OCR content one clip at a time.
+
+    Both backends yield the same {"duration", "extracted_content"} clip
+    data. A semester only saved as JSON so far is read from the JSON file,
+    so switching UPDATED_CONTENT_FORMAT to sqlite migrates on the next save.
+    """
+    content_file = get_updated_content_file(course_id, semester_key)
+    if UPDATED_CONTENT_FORMAT == "sqlite" and os.path.exists(content_file):
+        yield from iter_sqlite_content(content_file)
+        return
+    json_file = get_updated_content_file(course_id, semester_key, "json")
+    if os.path.exists(json_file):
+        yield from iter_json_object(json_file)
+
+
+def open_updated_content_writer(course_id, semester_key):
+    """Return a writer taking write(clip_id, clip_data) calls, one clip at a time.
+
+    Nothing replaces the current content until commit(), which the writer
+    also does when used as a context manager that exits cleanly.
+    """
+    content_file = get_updated_content_file(course_id, semester_key)
+    if UPDATED_CONTENT_FORMAT == "sqlite":
+        return SqliteContentWriter(content_file)
+    return JsonObjectWriter(content_file, indent=2)
+
+
+def load_updated_content(course_id, semester_key):
+    """Return the whole matched OCR content of a course-semester, or {} if there is none."""
+    return dict(iter_updated_content(course_id, semester_key))
+
+
+def save_updated_content(course_id, semester_key, content):
+    with open_updated_content_writer(course_id, semester_key) as writer:
+        for clip_id, clip_data in content.items():
+            writer.write(clip_id, clip_data)
+    return writer.file_path
+
+
+def split_entry(entry):
+    """Split an entry into its entry columns, matched slide and leftover keys."""
+    entry = dict(entry)
+    columns = [entry.pop(key, None) for key in ENTRY_COLUMNS]
+    slide = None
+    if all(key in entry for key, _ in SLIDE_COLUMNS):
+        slide = tuple(entry.pop(key) for key, _ in SLIDE_COLUMNS)
+    return columns, slide, entry
+
+
+class SqliteContentWriter:
+    """Builds the SQLite file clip by clip, with the same interface as JsonObjectWriter.
+
+    The database is built next to the target and renamed over it on
+    commit(), like write_json_atomic, so readers never see a half-written
+    file. Only the ids of the slides written so far are kept in memory.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.tmp_path = f"{file_path}.tmp"
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.connection = sqlite3.connect(self.tmp_path)
+        self.connection.executescript(SQLITE_SCHEMA)
+        self.slide_ids = {}
+        self.count = 0
+
+    def write(self, clip_id, clip_data):
+        clip_extra = {
+            key: value for key, value in clip_data.items() if key not in ("duration", "extracted_content")
+        }
+        self.connection.execute(
+            "INSERT INTO clips VALUES (?, ?, ?, ?)",
+            (clip_id, self.count, clip_data.get("duration"), json.dumps(clip_extra) if clip_extra else None),
+        )
+        entry_rows = []
+        for position, (ts, entry) in enumerate(clip_data.get("extracted_content", {}).items()):
+            columns, slide, extra = split_entry(entry)
+            slide_id = None
+            if slide is not None:
+                slide_id = self.slide_ids.get(slide)
+                if slide_id is None:
+                    slide_id = self.connection.execute(
+                        f"INSERT INTO slides VALUES (NULL, {', '.join('?' * len(SLIDE_COLUMNS))})", slide
+                    ).lastrowid
+                    self.slide_ids[slide] = slide_id
+            entry_rows.append(
+                (clip_id, ts, position, *columns, slide_id, json.dumps(extra, ensure_ascii=False) if extra else None)
+            )
+        self.connection.executemany(
+            f"INSERT INTO entries VALUES ({', '.join('?' * (len(ENTRY_COLUMNS) + 5))})", entry_rows
+        )
+        self.count += 1
+
+    def commit(self):
+        if self.connection is None:
+            return
+        self.connection.commit()
+        self.connection.close()
+        self.connection = None
+        os.replace(self.tmp_path, self.file_path)
+
+    def discard(self):
+        if self.connection is None:
+            return
+        self.connection.close()
+        self.connection = None
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+
+def iter_sqlite_content(content_file):
+    connection = sqlite3.connect(content_file)
+    try:
+        # Distinct slides only, so this stays small next to the entries.
+        slides = {
+            row[0]: dict(zip((key for key, _ in SLIDE_COLUMNS), row[1:]))
+            for row in connection.execute("SELECT * FROM slides")
+        }
+        clips = connection.execute("SELECT * FROM clips ORDER BY position")
+        for clip_id, _, duration, extra in clips:
+            clip_data = {"extracted_content": {}}
+            if duration is not None:
+                clip_data["duration"] = duration
+            if extra:
+                clip_data.update(json.loads(extra))
+
+            entries = connection.execute(
+                "SELECT * FROM entries WHERE clip_id = ? ORDER BY position", (clip_id,)
+            )
+            for _, ts, _, *row in entries:
+                *columns, slide_id, extra = row
+                entry = {key: value for key, value in zip(ENTRY_COLUMNS, columns) if value is not None}
+                if slide_id is not None:
+                    entry.update(slides[slide_id])
+                if extra:
+                    entry.update(json.loads(extra))
+                clip_data["extracted_content"][ts] = entry
+            yield clip_id, clip_data
+    finally:
+        connection.close()
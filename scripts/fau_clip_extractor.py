@@ -46,29 +46,49 @@ def fetch_clips(fau_id):
 
     return clips_detail
 
-def main():
-    all_data = {}
-    for course_id in COURSE_IDS:
-        semester_map = FAU_TV_COURSE_IDS.get(course_id, {})
-        if not isinstance(semester_map, dict):
+def get_course_semesters(course_id, verbose=True):
+    """Return the (semester_label, fau_course_id) pairs of a course with a valid FAU ID."""
+    semester_map = FAU_TV_COURSE_IDS.get(course_id, {})
+    if not isinstance(semester_map, dict):
+        if verbose:
             print(f"[WARN] Skipping {course_id}: not semesterized")
-            continue
+        return []
 
-        for semester_label, fau_course_id in semester_map.items():
-            if not fau_course_id or fau_course_id in {"_", "not available", "NA"}:
+    semesters = []
+    for semester_label, fau_course_id in semester_map.items():
+        if not fau_course_id or fau_course_id in {"_", "not available", "NA"}:
+            if verbose:
                 print(f"Skipping {course_id} ({semester_label}) — Invalid FAU ID.")
-                continue
+            continue
+        semesters.append((semester_label, fau_course_id))
+    return semesters
+
 
-            print(f"Extracting clip from course {course_id} ({semester_label})")
+def fetch_course_clips(course_id):
+    course_data = {}
+    for semester_label, fau_course_id in get_course_semesters(course_id):
+        print(f"Extracting clip from course {course_id} ({semester_label})")
 
-            clips = fetch_clips(fau_course_id)
+        clips = fetch_clips(fau_course_id)
 
         # save as: all_data["ai-1"]["WS24-25"] = {...}
-            all_data.setdefault(course_id, {})[semester_label] = {
-                "fau_course_id": fau_course_id,
-                "clips": clips
-             }
+        course_data[semester_label] = {
+            "fau_course_id": fau_course_id,
+            "clips": clips
+        }
+    return course_data
 
+
+def fetch_all_courses_clips():
+    all_data = {}
+    for course_id in COURSE_IDS:
+        course_data = fetch_course_clips(course_id)
+        if course_data:
+            all_data[course_id] = course_data
+    return all_data
+
+
+def save_all_courses_clips(all_data):
     clips_directory = os.path.dirname(all_courses_clips_path)
     if clips_directory: 
         os.makedirs(clips_directory, exist_ok=True)
@@ -76,5 +96,12 @@ def main():
     with open(all_courses_clips_path, "w", encoding="utf-8") as output_file:
         json.dump(all_data, output_file, indent=2,ensure_ascii=False)
 
+
+def main():
+    all_data = fetch_all_courses_clips()
+    save_all_courses_clips(all_data)
+    return all_data
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,100 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytesseract
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+from config import OCR_BACKEND, OCR_THREADS
+
+
+class PytesseractBackend:
+    """Runs the tesseract CLI once per image; the fallback when tesserocr is missing.
+
+    Batches are spread over OCR_THREADS threads, each waiting on its own
+    tesseract process.
+    """
+
+    name = "pytesseract"
+
+    def __init__(self, threads=OCR_THREADS):
+        self.threads = threads
+
+    def recognize(self, image):
+        return pytesseract.image_to_string(image).strip()
+
+    def recognize_batch(self, images):
+        if self.threads > 1 and len(images) > 1:
+            with ThreadPoolExecutor(max_workers=self.threads) as pool:
+                return list(pool.map(self.recognize, images))
+        return [self.recognize(image) for image in images]
+
+
+class TesserocrBackend:
+    """Keeps Tesseract loaded in-process through tesserocr.
+
+    The language data is loaded once per engine instead of once per
+    image. Batches are spread over OCR_THREADS threads with one engine
+    each; tesserocr releases the GIL while recognizing.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, threads=OCR_THREADS):
+        self.threads = threads
+        self.local = threading.local()
+        self.pool = None
+
+    def get_engine(self):
+        engine = getattr(self.local, "engine", None)
+        if engine is None:
+            engine = tesserocr.PyTessBaseAPI()
+            self.local.engine = engine
+        return engine
+
+    def recognize(self, image):
+        engine = self.get_engine()
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        bytes_per_pixel = 1 if image.ndim == 2 else image.shape[2]
+        if bytes_per_pixel == 3:
+            # OpenCV frames are BGR; Tesseract expects RGB.
+            image = np.ascontiguousarray(image[:, :, ::-1])
+        engine.SetImageBytes(image.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+        return engine.GetUTF8Text().strip()
+
+    def recognize_batch(self, images):
+        if self.threads > 1 and len(images) > 1:
+            # The pool outlives the batch so its threads keep their engines warm.
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.threads)
+            return list(self.pool.map(self.recognize, images))
+        return [self.recognize(image) for image in images]
+
+
+def create_ocr_backend(backend=OCR_BACKEND):
+    """Return the OCR backend named by OCR_BACKEND.
+
+    "auto" picks tesserocr when it is installed and falls back to
+    pytesseract otherwise, as does an explicit "tesserocr" without it.
+    """
+    if backend in ("auto", "tesserocr"):
+        if tesserocr is not None:
+            return TesserocrBackend()
+        if backend == "tesserocr":
+            print("tesserocr is not installed, falling back to pytesseract.")
+    return PytesseractBackend()
+
+
+_ocr_backend = None
+
+
+def get_ocr_backend():
+    # One backend per process, so each extraction worker keeps its engine
+    # warm across frames and clips.
+    global _ocr_backend
+    if _ocr_backend is None:
+        _ocr_backend = create_ocr_backend()
+        print(f"Using the {_ocr_backend.name} OCR backend.")
+    return _ocr_backend
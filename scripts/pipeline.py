@@ -0,0 +1,183 @@
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from config import COURSE_IDS, PIPELINE_WORKERS
+import fau_clip_extractor
+import slide_fetcher
+import video_text_extractor
+import slide_matcher
+import auto_detect
+import time_detect
+
+
+class Pipeline:
+    """Runs named stages in one process as soon as their dependencies finish.
+
+    Each stage is called with the results of the stages it depends on, in
+    the order they were listed. Stages whose dependencies failed are
+    skipped. Independent stages run concurrently on max_workers threads;
+    the heavy stages hand their work to process pools.
+    """
+
+    def __init__(self, max_workers=PIPELINE_WORKERS):
+        self.max_workers = max_workers
+        self.stages = {}
+        self.results = {}
+        self.timings = {}
+        self.failed = []
+        self.skipped = []
+
+    def add(self, name, func, deps=()):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+        self.stages[name] = (func, tuple(deps))
+
+    def run_stage(self, name):
+        func, deps = self.stages[name]
+        start = time.perf_counter()
+        try:
+            return func(*(self.results[dep] for dep in deps))
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def run(self):
+        waiting = dict(self.stages)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+
+            def schedule_ready():
+                # Skipping a stage can make its dependents skippable too, so
+                # keep going until a pass changes nothing.
+                changed = True
+                while changed:
+                    changed = False
+                    for name, (_, deps) in list(waiting.items()):
+                        if any(dep in self.failed or dep in self.skipped for dep in deps):
+                            print(f"[pipeline] Skipping {name}: a dependency did not finish.")
+                            self.skipped.append(name)
+                        elif all(dep in self.results for dep in deps):
+                            print(f"[pipeline] Starting {name}")
+                            running[pool.submit(self.run_stage, name)] = name
+                        else:
+                            continue
+                        del waiting[name]
+                        changed = True
+
+            schedule_ready()
+            while running:
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                        print(f"[pipeline] Finished {name} in {self.timings[name]:.1f}s")
+                    except Exception as e:
+                        print(f"[pipeline] Stage {name} failed: {e}")
+                        self.failed.append(name)
+                schedule_ready()
+        return not self.failed and not self.skipped
+
+    def print_timings(self, total_seconds):
+        print("\nStage timings:")
+        for name, seconds in sorted(self.timings.items(), key=lambda item: -item[1]):
+            status = "failed" if name in self.failed else "ok"
+            print(f"  {name:<40} {seconds:>9.1f}s  {status}")
+        for name in self.skipped:
+            print(f"  {name:<40} {'-':>10}  skipped")
+        kind_totals = {}
+        for name, seconds in self.timings.items():
+            kind = name.split(":", 1)[0]
+            kind_totals[kind] = kind_totals.get(kind, 0.0) + seconds
+        print("Time per stage kind (summed over courses):")
+        for kind, seconds in sorted(kind_totals.items(), key=lambda item: -item[1]):
+            print(f"  {kind:<40} {seconds:>9.1f}s")
+        print(f"Total wall time: {total_seconds:.1f}s")
+
+
+def build_pipeline(course_ids=COURSE_IDS):
+    """Wire the clip, slide, OCR, matching, duration and auto-detect stages.
+
+    Slides of a course are fetched while its videos are being OCR'd; a
+    course-semester is matched once both are done, independently of the
+    other courses.
+    """
+    pipeline = Pipeline()
+    pipeline.add("course_notes", slide_fetcher.load_course_notes_uris)
+
+    course_semesters = {
+        course_id: fau_clip_extractor.get_course_semesters(course_id)
+        for course_id in course_ids
+    }
+    clip_stages = []
+    duration_stages = []
+    for course_id, semesters in course_semesters.items():
+        clip_stage = f"clips:{course_id}"
+        slide_stage = f"slides:{course_id}"
+        pipeline.add(clip_stage, lambda course_id=course_id: fau_clip_extractor.fetch_course_clips(course_id))
+        pipeline.add(
+            slide_stage,
+            lambda _, course_id=course_id: slide_fetcher.update_course_slides(course_id),
+            deps=["course_notes"],
+        )
+        clip_stages.append(clip_stage)
+
+        for semester_key, _ in semesters:
+            stage_key = f"{course_id}:{semester_key}"
+            pipeline.add(
+                f"extract:{stage_key}",
+                lambda course_data, course_id=course_id, semester_key=semester_key: (
+                    video_text_extractor.process_course_videos(
+                        course_id, semester_key, course_data.get(semester_key, {})
+                    )
+                ),
+                deps=[clip_stage],
+            )
+            pipeline.add(
+                f"match:{stage_key}",
+                lambda all_slides, _, course_id=course_id, semester_key=semester_key: (
+                    slide_matcher.match_and_update_extracted_content(course_id, semester_key, all_slides)
+                ),
+                deps=[slide_stage, f"extract:{stage_key}"],
+            )
+            pipeline.add(
+                f"durations:{stage_key}",
+                lambda _, course_id=course_id, semester_key=semester_key: (
+                    time_detect.compute_time_per_slide_and_section(course_id, semester_key)
+                ),
+                deps=[f"match:{stage_key}"],
+            )
+            duration_stages.append(f"durations:{stage_key}")
+
+    def save_clips(*courses_data):
+        all_data = {
+            course_id: course_data
+            for course_id, course_data in zip(course_semesters, courses_data)
+            if course_data
+        }
+        fau_clip_extractor.save_all_courses_clips(all_data)
+        return all_data
+
+    pipeline.add("save_clips", save_clips, deps=clip_stages)
+    # auto_detect reads the updated files that the duration stages rewrite.
+    pipeline.add(
+        "auto_detect",
+        lambda all_data, *_: auto_detect.update_current_sem(all_data),
+        deps=["save_clips"] + duration_stages,
+    )
+    return pipeline
+
+
+def main():
+    start = time.perf_counter()
+    pipeline = build_pipeline()
+    succeeded = pipeline.run()
+    pipeline.print_timings(time.perf_counter() - start)
+    if not succeeded:
+        print("Pipeline finished with failed stages.")
+        sys.exit(1)
+    print("All stages ran successfully!")
+
+
+if __name__ == "__main__":
+    main()
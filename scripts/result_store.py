@@ -0,0 +1,289 @@
+import os
+import json
+from config import OCR_EXTRACTED_FILE_PATH
+
+# Bytes read at a time when streaming a results file; a value larger than
+# this doubles the read size until it fits.
+STREAM_CHUNK_SIZE = 1 << 20
+
+
+def get_results_file(course_id, semester_key):
+    return os.path.join(
+        OCR_EXTRACTED_FILE_PATH, f"{course_id}_{semester_key}_extracted_content.json"
+    )
+
+
+def get_journal_dir(course_id, semester_key):
+    return os.path.join(OCR_EXTRACTED_FILE_PATH, "journal", f"{course_id}_{semester_key}")
+
+
+def get_journal_file(course_id, semester_key, clip_id):
+    return os.path.join(get_journal_dir(course_id, semester_key), f"{clip_id}.jsonl")
+
+
+def write_json_atomic(file_path, data, indent=4):
+    # Write next to the target and rename over it, so a crash mid-write
+    # leaves the previous version in place instead of a truncated file.
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+def iter_json_object(file_path, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the (key, value) pairs of a top-level JSON object one at a time.
+
+    Only the current value is held in memory, so a course-semester file can
+    be walked clip by clip.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, "r", encoding="utf-8") as f:
+        buffer = ""
+        eof = False
+
+        def read_more():
+            nonlocal buffer, eof
+            chunk = f.read(max(chunk_size, len(buffer)))
+            if not chunk:
+                eof = True
+            buffer += chunk
+
+        def peek():
+            nonlocal buffer
+            while True:
+                buffer = buffer.lstrip()
+                if buffer or eof:
+                    return buffer[:1]
+                read_more()
+
+        def consume(expected):
+            nonlocal buffer
+            char = peek()
+            if char != expected:
+                raise ValueError(f"Expected {expected!r} in {file_path}, found {char!r}")
+            buffer = buffer[1:]
+
+        def decode_value():
+            nonlocal buffer
+            peek()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer)
+                    # A number cut off by the chunk boundary also decodes, so
+                    # only trust a value that is followed by a delimiter.
+                    rest = buffer[end:].lstrip()
+                    if eof or rest[:1] in (",", "}", ":"):
+                        buffer = rest
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                read_more()
+
+        consume("{")
+        if peek() == "}":
+            return
+        while True:
+            key = decode_value()
+            consume(":")
+            yield key, decode_value()
+            if peek() == "}":
+                return
+            consume(",")
+
+
+class JsonObjectWriter:
+    """Write a top-level JSON object one key at a time.
+
+    The output matches json.dump with the same indent. Like
+    write_json_atomic it goes to a temporary file that replaces file_path
+    on commit(); discard() drops it and leaves file_path as it was.
+    """
+
+    def __init__(self, file_path, indent=4):
+        self.file_path = file_path
+        self.tmp_path = f"{file_path}.tmp"
+        self.indent = indent
+        self.count = 0
+        self.f = open(self.tmp_path, "w", encoding="utf-8")
+        self.f.write("{")
+
+    def write(self, key, value):
+        separator = "," if self.count else ""
+        if self.indent is None:
+            self.f.write(f"{separator}{json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}")
+        else:
+            newline = "\n" + " " * self.indent
+            # JSON strings cannot hold raw newlines, so this only indents.
+            value_text = json.dumps(value, indent=self.indent, ensure_ascii=False).replace("\n", newline)
+            self.f.write(f"{separator}{newline}{json.dumps(key, ensure_ascii=False)}: {value_text}")
+        self.count += 1
+
+    def commit(self):
+        if self.f.closed:
+            return
+        self.f.write("\n}" if self.count and self.indent is not None else "}")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        os.replace(self.tmp_path, self.file_path)
+
+    def discard(self):
+        if self.f.closed:
+            return
+        self.f.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+
+def merge_clip_results(existing_data, clip_id, extracted_content, video_duration=None):
+    if clip_id not in existing_data:
+        existing_data[clip_id] = {"extracted_content": {}}
+    if video_duration is not None:
+        if ("duration" not in existing_data[clip_id] or abs(float(existing_data[clip_id]["duration"]) - float(video_duration)) > 0.001):
+            existing_data[clip_id]["duration"] = float(video_duration)
+
+    existing_extracted_content = existing_data[clip_id]["extracted_content"]
+    new_extracted = {str(k): v for k, v in extracted_content.items()}
+    existing_extracted_content.update(new_extracted)
+
+
+def append_clip_records(journal_file, clip_id, extracted_content, video_duration=None):
+    """Append one record with the given entries of a clip to its journal.
+
+    Entries are keyed by start time, so a later record for the same key
+    replaces the earlier one on replay.
+    """
+    journal_dir = os.path.dirname(journal_file)
+    if journal_dir:
+        os.makedirs(journal_dir, exist_ok=True)
+    record = {
+        "clip_id": clip_id,
+        "duration": video_duration,
+        "extracted_content": {str(k): v for k, v in extracted_content.items()},
+    }
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with open(journal_file, "ab+") as f:
+        # Start on a fresh line if a crash left a torn record behind.
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                line = "\n" + line
+        f.write(line.encode("utf-8"))
+
+
+def replay_journal(journal_file, existing_data=None):
+    if existing_data is None:
+        existing_data = {}
+    with open(journal_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-append leaves a torn line behind.
+                print(f"Skipping unreadable journal record in {journal_file}")
+                continue
+            merge_clip_results(
+                existing_data,
+                record["clip_id"],
+                record.get("extracted_content", {}),
+                record.get("duration"),
+            )
+    return existing_data
+
+
+def list_journal_files(course_id, semester_key, clip_ids=None):
+    journal_dir = get_journal_dir(course_id, semester_key)
+    if not os.path.isdir(journal_dir):
+        return []
+    journal_files = []
+    for journal_name in sorted(os.listdir(journal_dir)):
+        clip_id, ext = os.path.splitext(journal_name)
+        if ext != ".jsonl":
+            continue
+        if clip_ids is not None and clip_id not in clip_ids:
+            continue
+        journal_files.append(os.path.join(journal_dir, journal_name))
+    return journal_files
+
+
+def load_results(course_id, semester_key):
+    """Return the course-semester results, including clips still in progress.
+
+    This is the compacted JSON view with any pending journal records
+    replayed on top of it.
+    """
+    results_file = get_results_file(course_id, semester_key)
+    if os.path.exists(results_file):
+        with open(results_file, "r", encoding="utf-8") as f:
+            results = json.load(f)
+    else:
+        results = {}
+    for journal_file in list_journal_files(course_id, semester_key):
+        replay_journal(journal_file, results)
+    return results
+
+
+def results_exist(course_id, semester_key):
+    return os.path.exists(get_results_file(course_id, semester_key)) or bool(
+        list_journal_files(course_id, semester_key)
+    )
+
+
+def iter_results(course_id, semester_key, clip_ids=None):
+    """Yield (clip_id, clip_data) like load_results, one clip at a time.
+
+    Clips only present in journals come last. With clip_ids, the other
+    clips are skipped without replaying their journals.
+    """
+    journal_files = {
+        os.path.splitext(os.path.basename(journal_file))[0]: journal_file
+        for journal_file in list_journal_files(course_id, semester_key, clip_ids)
+    }
+    results_file = get_results_file(course_id, semester_key)
+    if os.path.exists(results_file):
+        for clip_id, clip_data in iter_json_object(results_file):
+            if clip_ids is not None and clip_id not in clip_ids:
+                continue
+            clip_results = {clip_id: clip_data}
+            journal_file = journal_files.pop(clip_id, None)
+            if journal_file:
+                replay_journal(journal_file, clip_results)
+            yield from clip_results.items()
+    for journal_file in journal_files.values():
+        yield from replay_journal(journal_file).items()
+
+
+def compact_journals(course_id, semester_key, clip_ids=None):
+    """Fold clip journals into the course-semester JSON view.
+
+    Compacts every journal when clip_ids is None, which also recovers
+    journals left behind by an interrupted run. Returns the compacted view.
+    """
+    results_file = get_results_file(course_id, semester_key)
+    if os.path.exists(results_file):
+        with open(results_file, "r", encoding="utf-8") as f:
+            results = json.load(f)
+    else:
+        results = {}
+
+    journal_files = list_journal_files(course_id, semester_key, clip_ids)
+    if not journal_files:
+        return results
+
+    for journal_file in journal_files:
+        replay_journal(journal_file, results)
+    write_json_atomic(results_file, results)
+    for journal_file in journal_files:
+        os.remove(journal_file)
+    return results
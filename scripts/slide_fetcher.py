@@ -1,34 +1,62 @@
 import os
 import json
+import hashlib
+import multiprocessing
 import requests
 import re
-from typing import Any, List, Dict, TypedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, List, Dict, Optional, Tuple, TypedDict
 from urllib.parse import quote
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
 from datetime import datetime, timedelta
+from result_store import write_json_atomic
 from config import (
     COURSE_API_BASE_URL,
     COURSE_IDS,
     NEXT_PUBLIC_FLAMS_URL,
     SLIDES_OUTPUT_DIR,
     SLIDES_EXPIRY_DAYS,
+    SLIDE_FETCH_WORKERS,
+    SLIDE_PROCESS_WORKERS,
+    HTML_TEXT_EXTRACTOR,
+    PROCESS_START_METHOD,
     COURSE_IDS,
 )
 
 COURSE_NOTES_URIS: Dict[str, str] = {}
 
+# Shared keep-alive session, sized so every fetch worker keeps its connection.
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_maxsize=max(10, SLIDE_FETCH_WORKERS)))
+session.mount("https://", HTTPAdapter(pool_maxsize=max(10, SLIDE_FETCH_WORKERS)))
+
 def fetch_slides(course_id: str, section_id: str) -> List[Dict]:
+    return fetch_section_slides(course_id, section_id)[0]
+
+def fetch_section_slides(course_id: str, section_id: str, etag: str = "") -> Tuple[Optional[List[Dict]], str]:
+    """Fetch the slides of a section, conditionally if an ETag is known.
+
+    Returns (None, etag) when the server answers 304 Not Modified.
+    """
     encoded_section_id = quote(section_id, safe='')
     url = f"{COURSE_API_BASE_URL}/get-slides?courseId={course_id}&sectionIds={encoded_section_id}"
-    response = requests.get(url)
+    headers = {"If-None-Match": etag} if etag else {}
+    response = session.get(url, headers=headers)
+    if response.status_code == 304:
+        return None, etag
     response.raise_for_status()
-    return response.json().get(section_id, {}).get("slides", [])
+    return response.json().get(section_id, {}).get("slides", []), response.headers.get("ETag", "")
 
 def fetch_toc(course_id:str)->List[Dict]:
     notes_uri=COURSE_NOTES_URIS.get(course_id)
     encoded_uri = quote(notes_uri, safe='')
     url = f"{NEXT_PUBLIC_FLAMS_URL}/content/toc?uri={encoded_uri}"
-    response = requests.get(url)
+    response = session.get(url)
     response.raise_for_status()
     toc_response = response.json()
     if isinstance(toc_response, list) and len(toc_response) > 1:
@@ -37,34 +65,76 @@ def fetch_toc(course_id:str)->List[Dict]:
         raise ValueError("Unexpected TOC format from API")
 class SectionSlides(TypedDict):
     section_uri: str
+    section_title: str
     slides: List[Dict]
+    etag: str
+    section_hash: str
+
+def compute_section_hash(section_uri: str, section_title: str, slides: List[Dict]) -> str:
+    payload = json.dumps([section_uri, section_title, slides], sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
     
-def get_frame_slides_by_section(toc_elems: List[Dict], course_id: str) -> Dict[str, SectionSlides]:
-    by_section = {}
+def collect_sections(toc_elems: List[Dict]) -> List[Dict]:
+    sections = []
     for elem in toc_elems:
         if elem.get("type") == "Section":
+            sections.append(elem)
+        if "children" in elem and isinstance(elem["children"], list):
+            sections.extend(collect_sections(elem["children"]))
+    return sections
+
+def get_frame_slides_by_section(
+    toc_elems: List[Dict], course_id: str, previous_sections: Optional[Dict[str, SectionSlides]] = None
+) -> Dict[str, SectionSlides]:
+    """Fetch the frame slides of every TOC section.
+
+    With previous_sections, each section is requested with the ETag it had
+    last time and the previous slides are kept when it is not modified.
+    """
+    previous_sections = previous_sections or {}
+    sections = collect_sections(toc_elems)
+
+    def fetch(elem):
+        previous = previous_sections.get(elem["id"], {})
+        return fetch_section_slides(course_id, elem["id"], previous.get("etag", ""))
+
+    with ThreadPoolExecutor(max_workers=SLIDE_FETCH_WORKERS) as fetch_pool:
+        # map yields in submission order, so the result keeps the TOC order.
+        section_slides = fetch_pool.map(fetch, sections)
+        by_section = {}
+        for elem, (slide_elements, etag) in zip(sections, section_slides):
             sec_id = elem["id"]
             sec_uri = elem.get("uri", "")
             sec_title=elem.get("title","")
-            slide_elements = fetch_slides(course_id,sec_id)
-            frame_slides = []
-            for slide in slide_elements:
-                if not isinstance(slide, dict):
-                    print(f"[Warning] Skipping non-dict slide in section {sec_id}: {slide}")
-                    continue
-                if slide.get("slideType") == "FRAME" and "slide" in slide:
-                    frame_slides.append(slide["slide"])
+            if slide_elements is None:
+                frame_slides = previous_sections[sec_id]["slides"]
+            else:
+                frame_slides = []
+                for slide in slide_elements:
+                    if not isinstance(slide, dict):
+                        print(f"[Warning] Skipping non-dict slide in section {sec_id}: {slide}")
+                        continue
+                    if slide.get("slideType") == "FRAME" and "slide" in slide:
+                        frame_slides.append(slide["slide"])
 
             by_section[sec_id] = {
                 "section_uri": sec_uri,
                 "section_title":sec_title,
-                "slides": frame_slides
+                "slides": frame_slides,
+                "etag": etag,
+                "section_hash": compute_section_hash(sec_uri, sec_title, frame_slides),
             }
-        if "children" in elem and isinstance(elem["children"], list):
-            child_sections = get_frame_slides_by_section(elem["children"], course_id)
-            by_section.update(child_sections)
     return by_section
 
+def find_changed_sections(previous_sections: Dict[str, SectionSlides], sections: Dict[str, SectionSlides]) -> List[str]:
+    changed = [
+        sec_id
+        for sec_id, section in sections.items()
+        if previous_sections.get(sec_id, {}).get("section_hash") != section["section_hash"]
+    ]
+    removed = [sec_id for sec_id in previous_sections if sec_id not in sections]
+    return changed + removed
+
 def clean_text(text: str) -> str:
     text = re.sub(r"\s+", " ", text.strip())
     return text
@@ -82,9 +152,10 @@ def remove_last_line_if_frame(slide_content: str) -> str:
     return "\n".join(lines)
 
 
-def get_all_slides(course_id: str) -> Dict:
+def get_all_slides(course_id: str, previous_data: Optional[Dict] = None) -> Dict:
     toc_data=fetch_toc(course_id)
-    frame_slides_by_section = get_frame_slides_by_section(toc_data,course_id)
+    previous_sections = (previous_data or {}).get("sections", {})
+    frame_slides_by_section = get_frame_slides_by_section(toc_data,course_id, previous_sections)
     return {
         "courseId": course_id,
         "sections": frame_slides_by_section,
@@ -104,12 +175,26 @@ def load_from_disk(file_path: str) -> Dict:
         return json.load(f)
 
 
-def html_to_text(html_content):
+def html_to_text_bs4(html_content):
     if not html_content:
         return ""
     soup = BeautifulSoup(html_content, "html.parser")
     return soup.get_text()
 
+def html_to_text_lxml(html_content):
+    if not html_content:
+        return ""
+    root = lxml.html.fragment_fromstring(html_content, create_parent="div")
+    # BeautifulSoup's get_text() leaves out these, so drop them to match it.
+    for elem in root.xpath("//script|//style|//template|//comment()"):
+        elem.drop_tree()
+    return "".join(root.itertext())
+
+def html_to_text(html_content):
+    if HTML_TEXT_EXTRACTOR == "bs4" or lxml is None:
+        return html_to_text_bs4(html_content)
+    return html_to_text_lxml(html_content)
+
 def process_section(section_id: str,section_uri:str,section_title:str, slides: List[Dict]) -> List[Dict]:
     processed_slides = []
     for slide in slides:
@@ -126,20 +211,62 @@ def process_section(section_id: str,section_uri:str,section_title:str, slides: L
         })
     return processed_slides
 
-def process_slides(input_file: str, output_file: str):
-    with open(input_file, "r", encoding="utf-8") as file:
-        data = json.load(file)
+def process_slides(input_file: str, output_file: str, data: Optional[Dict] = None) -> List[Dict]:
+    """Write the processed slides of every section to output_file and return them.
+
+    Sections whose sectionHash matches the previous output are copied over
+    instead of being processed again. Pass data to skip re-reading
+    input_file when the caller already has it loaded.
+    """
+    if data is None:
+        with open(input_file, "r", encoding="utf-8") as file:
+            data = json.load(file)
     slides_by_section = data.get("sections", {})
-    processed_data = []
+
+    previous_by_section = {}
+    if os.path.exists(output_file):
+        with open(output_file, "r", encoding="utf-8") as file:
+            for slide in json.load(file):
+                previous_by_section.setdefault(slide["sectionId"], []).append(slide)
+
+    processed_by_section = {}
+    changed_sections = []
     for section_id, section_info in slides_by_section.items():
-        section_uri = section_info.get("section_uri", "")
-        section_title=section_info.get("section_title","")
-        slides = section_info.get("slides", [])
-        processed_data.extend(process_section(section_id,section_uri,section_title,slides))
-    with open(output_file, "w", encoding="utf-8") as file:
-        json.dump(processed_data, file, ensure_ascii=False, indent=4)
+        section_hash = section_info.get("section_hash", "")
+        previous_slides = previous_by_section.get(section_id)
+        if section_hash and previous_slides and previous_slides[0].get("sectionHash") == section_hash:
+            processed_by_section[section_id] = previous_slides
+        else:
+            changed_sections.append(section_id)
 
-    print(f"Processed slides have been saved to {output_file}")
+    section_args = (
+        changed_sections,
+        [slides_by_section[sec_id].get("section_uri", "") for sec_id in changed_sections],
+        [slides_by_section[sec_id].get("section_title", "") for sec_id in changed_sections],
+        [slides_by_section[sec_id].get("slides", []) for sec_id in changed_sections],
+    )
+    if SLIDE_PROCESS_WORKERS > 1 and len(changed_sections) > 1:
+        with ProcessPoolExecutor(
+            max_workers=SLIDE_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context(PROCESS_START_METHOD),
+        ) as process_pool:
+            section_results = list(process_pool.map(process_section, *section_args))
+    else:
+        section_results = list(map(process_section, *section_args))
+    for section_id, section_slides in zip(changed_sections, section_results):
+        for slide in section_slides:
+            slide["sectionHash"] = slides_by_section[section_id].get("section_hash", "")
+        processed_by_section[section_id] = section_slides
+
+    processed_data = []
+    for section_id in slides_by_section:
+        processed_data.extend(processed_by_section[section_id])
+    reprocessed_count = len(changed_sections)
+    # Atomic, since slide matching may read this file while it is rewritten.
+    write_json_atomic(output_file, processed_data)
+
+    print(f"Processed slides have been saved to {output_file} ({reprocessed_count}/{len(slides_by_section)} sections reprocessed)")
+    return processed_data
 
 
 def is_cache_valid(file_path: str) -> bool:
@@ -164,7 +291,7 @@ def parse_course_notes_uris(raw_data: List[Any]) -> Dict[str, str]:
 def get_course_notes_uris() -> Dict[str, str]:
     url = f"{NEXT_PUBLIC_FLAMS_URL}/api/index"
     try:
-        response = requests.post(url)
+        response = session.post(url)
         response.raise_for_status()
         data = response.json()
         return parse_course_notes_uris(data)
@@ -172,45 +299,59 @@ def get_course_notes_uris() -> Dict[str, str]:
         print(f"Failed to fetch course notes URIs: {e}")
         return {}
 
-def main():
+def load_course_notes_uris():
     global COURSE_NOTES_URIS
     COURSE_NOTES_URIS = get_course_notes_uris()
-    for course_id in COURSE_IDS:
-        original_slides_file = os.path.join(
-            SLIDES_OUTPUT_DIR, f"{course_id}_slides.json"
-        )
-        processed_slides_file = os.path.join(
-            SLIDES_OUTPUT_DIR, f"{course_id}_processed_slides.json"
-        )
 
-        if is_cache_valid(original_slides_file):
-            try:
-                data = load_from_disk(original_slides_file)
-                print(f"Loaded original slides for course {course_id} from disk.")
-            except FileNotFoundError:
-                print(
-                    f"Original slides for course {course_id} not found locally. Fetching from API..."
-                )
-                data = get_all_slides(course_id)
-                save_to_disk(original_slides_file, data)
-                print(
-                    f"Original slides for course {course_id} saved locally at {original_slides_file}."
-                )
-        else:
+
+def update_course_slides(course_id: str) -> List[Dict]:
+    """Refresh the slide cache of a course and return its processed slides."""
+    original_slides_file = os.path.join(
+        SLIDES_OUTPUT_DIR, f"{course_id}_slides.json"
+    )
+    processed_slides_file = os.path.join(
+        SLIDES_OUTPUT_DIR, f"{course_id}_processed_slides.json"
+    )
+
+    if is_cache_valid(original_slides_file):
+        try:
+            data = load_from_disk(original_slides_file)
+            print(f"Loaded original slides for course {course_id} from disk.")
+        except FileNotFoundError:
             print(
-                f"Cache expired or original slides for course {course_id} not found locally. Fetching from API..."
+                f"Original slides for course {course_id} not found locally. Fetching from API..."
             )
             data = get_all_slides(course_id)
             save_to_disk(original_slides_file, data)
             print(
                 f"Original slides for course {course_id} saved locally at {original_slides_file}."
             )
-
-        print(f"Processing slides for course {course_id} to clean and simplify data...")
-        process_slides(original_slides_file, processed_slides_file)
+    else:
         print(
-            f"Processed slides for course {course_id} saved at {processed_slides_file}."
+            f"Cache expired or original slides for course {course_id} not found locally. Fetching from API..."
         )
+        previous_data = load_from_disk(original_slides_file) if os.path.exists(original_slides_file) else None
+        data = get_all_slides(course_id, previous_data)
+        if previous_data is not None:
+            changed_sections = find_changed_sections(previous_data.get("sections", {}), data["sections"])
+            print(f"{len(changed_sections)} of {len(data['sections'])} sections changed for course {course_id}.")
+        save_to_disk(original_slides_file, data)
+        print(
+            f"Original slides for course {course_id} saved locally at {original_slides_file}."
+        )
+
+    print(f"Processing slides for course {course_id} to clean and simplify data...")
+    processed_slides = process_slides(original_slides_file, processed_slides_file, data)
+    print(
+        f"Processed slides for course {course_id} saved at {processed_slides_file}."
+    )
+    return processed_slides
+
+
+def main():
+    load_course_notes_uris()
+    for course_id in COURSE_IDS:
+        update_course_slides(course_id)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,27 @@
+import hashlib
+import heapq
 import json
 import os
 import re
+from collections import defaultdict
 from rapidfuzz import fuzz, process
-from config import OCR_EXTRACTED_FILE_PATH, SLIDES_OUTPUT_DIR, COURSE_IDS, ALL_COURSES_CLIPS_JSON
+from config import (
+    SLIDES_OUTPUT_DIR,
+    COURSE_IDS,
+    ALL_COURSES_CLIPS_JSON,
+    SLIDE_MATCH_CANDIDATES,
+    SLIDE_MATCH_MODE,
+)
+from result_store import iter_results, results_exist, write_json_atomic
+from content_store import get_updated_content_file, iter_updated_content, open_updated_content_writer
+
+MIN_OCR_TEXT_LENGTH = 100
+MATCH_SCORE_THRESHOLD = 70
+# Tokens found on more than this share of slides say nothing about which
+# slide is shown and are left out of the index.
+MAX_TOKEN_SLIDE_SHARE = 0.25
+# Rows of OCR texts scored per cdist call, to bound the score matrix size.
+CDIST_CHUNK_SIZE = 1000
 
 
 def clean_text(text: str) -> str:
@@ -11,78 +30,376 @@ def clean_text(text: str) -> str:
     return text
 
 
-def match_and_update_extracted_content(course_id,semester_key):
+def tokenize(text: str) -> set:
+    return set(re.findall(r"\w\w+", text.lower()))
+
+
+class SlideIndex:
+    """Inverted token index over the cleaned slide texts of a course.
+
+    Shortlists the slides sharing the most tokens with an OCR text, then
+    rescores only those with token_set_ratio. A candidate_count of 0 scores
+    every slide, like a plain extractOne over the course. In "cdist" mode
+    the shortlist is skipped and a whole batch is scored against every
+    slide in one multi-threaded rapidfuzz call.
+    """
+
+    def __init__(self, slides, candidate_count=SLIDE_MATCH_CANDIDATES, mode=SLIDE_MATCH_MODE):
+        self.slides = slides
+        self.texts = [slide["cleaned_slide_content"] for slide in slides]
+        self.candidate_count = candidate_count
+        self.mode = mode
+        self.slide_tokens = [tokenize(text) for text in self.texts]
+
+        postings = defaultdict(list)
+        for slide_idx, tokens in enumerate(self.slide_tokens):
+            for token in tokens:
+                postings[token].append(slide_idx)
+        max_postings = max(1, int(len(slides) * MAX_TOKEN_SLIDE_SHARE))
+        self.postings = {
+            token: slide_ids
+            for token, slide_ids in postings.items()
+            if len(slide_ids) <= max_postings
+        }
+
+    def candidates(self, ocr_text):
+        if not self.candidate_count:
+            return range(len(self.texts))
+        query_tokens = tokenize(ocr_text)
+        shared = defaultdict(int)
+        for token in query_tokens:
+            for slide_idx in self.postings.get(token, ()):
+                shared[slide_idx] += 1
+        # Rank by overlap coefficient, which like token_set_ratio favours a
+        # text whose tokens are all contained in the other.
+        # Ties go to the earlier slide, so the shortlist does not depend on
+        # set iteration order, which changes between runs.
+        shortlist = heapq.nlargest(
+            self.candidate_count,
+            shared,
+            key=lambda slide_idx: (
+                shared[slide_idx] / max(1, min(len(query_tokens), len(self.slide_tokens[slide_idx]))),
+                -slide_idx,
+            ),
+        )
+        # Keep slide order so ties resolve to the same slide as a full scan.
+        return sorted(shortlist)
+
+    def best_match(self, ocr_text):
+        """Return (slide, score); slide is None when no slide scores above
+        MATCH_SCORE_THRESHOLD."""
+        choices = {slide_idx: self.texts[slide_idx] for slide_idx in self.candidates(ocr_text)}
+        if not choices:
+            return None, 0
+        best_match = process.extractOne(ocr_text, choices, scorer=fuzz.token_set_ratio)
+        if not best_match:
+            return None, 0
+        if best_match[1] > MATCH_SCORE_THRESHOLD:
+            return self.slides[best_match[2]], best_match[1]
+        return None, best_match[1]
+
+    def match_all(self, ocr_texts):
+        """Match a batch of OCR texts, scoring each distinct text once.
+
+        Returns a (slide, score) pair per text, as best_match does.
+        """
+        if self.mode == "cdist":
+            matches = self.match_all_cdist(list(dict.fromkeys(ocr_texts)))
+        else:
+            matches = {}
+            for ocr_text in ocr_texts:
+                if ocr_text not in matches:
+                    matches[ocr_text] = self.best_match(ocr_text)
+        return [matches[ocr_text] for ocr_text in ocr_texts]
+
+    def match_all_cdist(self, ocr_texts):
+        matches = {ocr_text: (None, 0) for ocr_text in ocr_texts}
+        if not self.texts:
+            return matches
+        for chunk_start in range(0, len(ocr_texts), CDIST_CHUNK_SIZE):
+            chunk = ocr_texts[chunk_start : chunk_start + CDIST_CHUNK_SIZE]
+            scores = process.cdist(chunk, self.texts, scorer=fuzz.token_set_ratio, workers=-1)
+            # argmax returns the first maximum, the same slide extractOne picks.
+            best_slide_ids = scores.argmax(axis=1)
+            for row, slide_idx in enumerate(best_slide_ids):
+                score = float(scores[row, slide_idx])
+                if score > MATCH_SCORE_THRESHOLD:
+                    matches[chunk[row]] = (self.slides[slide_idx], score)
+                else:
+                    matches[chunk[row]] = (None, score)
+        return matches
+
+
+MATCH_FIELDS = ["sectionId", "sectionUri", "sectionTitle", "slideUri", "slideContent", "slideHtml"]
+
+
+def apply_slide_match(text_entry, matched_slide):
+    text_entry["sectionId"] = matched_slide["sectionId"]
+    text_entry["sectionUri"] = matched_slide["sectionUri"]
+    text_entry["sectionTitle"] = matched_slide["sectionTitle"]
+    text_entry["slideUri"] = matched_slide["slideUri"]
+    text_entry["slideContent"] = matched_slide["slideContent"]
+    text_entry["slideHtml"] = matched_slide["html"]
+
+
+def get_section_hashes(all_slides):
+    """Fingerprint every section of the processed slides.
+
+    Uses the sectionHash written by slide_fetcher, falling back to hashing
+    the section's slides for files written before it existed.
+    """
+    section_slides = defaultdict(list)
+    for slide in all_slides:
+        section_slides[slide["sectionId"]].append(slide)
+    section_hashes = {}
+    for section_id, slides in section_slides.items():
+        section_hash = slides[0].get("sectionHash")
+        if not section_hash:
+            payload = json.dumps(
+                [[slide.get(field, "") for field in ("sectionUri", "sectionTitle", "slideUri", "slideContent")] for slide in slides]
+            )
+            section_hash = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+        section_hashes[section_id] = section_hash
+    return section_hashes
+
+
+def load_json_if_exists(file_path):
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ClipLookup:
+    """Finds clips in a stream of (clip_id, clip_data), reading ahead only as far as needed.
+
+    Streams in the same clip order as the lookups, such as an updated file
+    and the OCR results it was written from, are walked in step while
+    holding a single clip. Clips that are passed over are kept until asked
+    for.
+    """
+
+    def __init__(self, clips):
+        self.clips = iter(clips)
+        self.passed = {}
+
+    def pop(self, clip_id):
+        if clip_id in self.passed:
+            return self.passed.pop(clip_id)
+        for other_clip_id, clip_data in self.clips:
+            if other_clip_id == clip_id:
+                return clip_data
+            self.passed[other_clip_id] = clip_data
+        return None
+
+    def remaining(self):
+        passed, self.passed = self.passed, {}
+        yield from passed.items()
+        yield from self.clips
+
+
+def match_clip(video_data, previous_data, previous_clip_states, changed_sections, slide_index, changed_slide_index):
+    """Match the OCR entries of one clip, reusing the previous run where possible.
+
+    Returns the clip's entry states and its (matched, rescored, reused) counts.
+    """
+    clip_states = {}
+    full_matches = []
+    changed_section_matches = []
+    reused_count = 0
+    if "extracted_content" in video_data:
+        previous_content = (previous_data or {}).get("extracted_content", {})
+        for timestamp, text_entry in video_data["extracted_content"].items():
+            previous_entry = previous_content.get(timestamp, {})
+            if (
+                "duration" in previous_entry
+                and previous_entry.get("start_time") == text_entry.get("start_time")
+                and previous_entry.get("end_time") == text_entry.get("end_time")
+            ):
+                text_entry["duration"] = previous_entry["duration"]
+
+            ocr_text = clean_text(text_entry.get("ocr_slide_content", ""))
+
+            if len(ocr_text) >= MIN_OCR_TEXT_LENGTH:
+                text_entry["sectionId"] = ""
+                text_entry["sectionUri"] = ""
+                text_entry["sectionTitle"] = ""
+                text_entry["slideUri"] =""
+                text_entry["slideContent"] = ""
+                text_entry["slideHtml"] = ""
+
+                ocr_hash = hashlib.sha1(ocr_text.encode("utf-8")).hexdigest()
+                previous_entry_state = previous_clip_states.get(timestamp)
+                clip_states[timestamp] = [ocr_hash, 0]
+                # The previous match can only be kept if the previous updated
+                # file still has it, not just the match state. An entry left
+                # unmatched despite a passing score lost its match the same way.
+                if (
+                    not previous_entry_state
+                    or previous_entry_state[0] != ocr_hash
+                    or not all(field in previous_entry for field in MATCH_FIELDS)
+                    or (not previous_entry["slideUri"] and previous_entry_state[1] > MATCH_SCORE_THRESHOLD)
+                    or previous_entry["sectionId"] in changed_sections
+                ):
+                    full_matches.append((timestamp, text_entry, ocr_text))
+                    continue
+
+                # Same OCR text as last run and its section is unchanged:
+                # keep its match, and only look at slides of sections that
+                # changed since.
+                for field in MATCH_FIELDS:
+                    text_entry[field] = previous_entry[field]
+                clip_states[timestamp][1] = previous_entry_state[1]
+                if not changed_sections:
+                    reused_count += 1
+                else:
+                    changed_section_matches.append((timestamp, text_entry, ocr_text))
+
+    if full_matches:
+        matches = slide_index.match_all([ocr_text for *_, ocr_text in full_matches])
+        for (timestamp, text_entry, _), (matched_slide, score) in zip(full_matches, matches):
+            clip_states[timestamp][1] = score
+            if matched_slide is not None:
+                apply_slide_match(text_entry, matched_slide)
+
+    if changed_section_matches:
+        matches = changed_slide_index.match_all([ocr_text for *_, ocr_text in changed_section_matches])
+        for (timestamp, text_entry, _), (matched_slide, score) in zip(changed_section_matches, matches):
+            if matched_slide is not None and score > clip_states[timestamp][1]:
+                clip_states[timestamp][1] = score
+                apply_slide_match(text_entry, matched_slide)
+
+    return clip_states, (len(full_matches), len(changed_section_matches), reused_count)
+
+
+def match_and_update_extracted_content(course_id,semester_key, all_slides=None, clip_ids=None):
+    """Match OCR entries to slides and write the updated extracted content.
+
+    Clips are read, matched and written one at a time, so memory grows with
+    the largest clip rather than with the semester.
+
+    With clip_ids, only those clips are matched and merged into the
+    existing updated file, as long as the slides are the ones the other
+    clips were matched against; otherwise every clip is (re)matched.
+    Returns the IDs of the clips that were (re)matched, or None if there
+    was nothing to match.
+    """
     processed_slides_file_path = os.path.join(
         SLIDES_OUTPUT_DIR, f"{course_id}_processed_slides.json"
     )
-    ocr_extracted_file_path = os.path.join(
-        OCR_EXTRACTED_FILE_PATH, f"{course_id}_{semester_key}_extracted_content.json"
-    )
-    updated_extracted_file_path = os.path.join(
-        SLIDES_OUTPUT_DIR, f"{course_id}_{semester_key}_updated_extracted_content.json"
+    updated_extracted_file_path = get_updated_content_file(course_id, semester_key)
+    match_state_file_path = os.path.join(
+        SLIDES_OUTPUT_DIR, f"{course_id}_{semester_key}_match_state.json"
     )
 
-    if not os.path.exists(processed_slides_file_path):
+    if all_slides is None and not os.path.exists(processed_slides_file_path):
         print(f"Processed slides file not found: {processed_slides_file_path}")
         return
 
-    if not os.path.exists(ocr_extracted_file_path):
-        print(f"OCR extracted file not found: {ocr_extracted_file_path}")
+    if not results_exist(course_id, semester_key):
+        print(f"No OCR extracted content for {course_id} ({semester_key})")
         return
 
-    with open(processed_slides_file_path, "r", encoding="utf-8") as slides_file:
-        all_slides = json.load(slides_file)
+    if all_slides is None:
+        with open(processed_slides_file_path, "r", encoding="utf-8") as slides_file:
+            all_slides = json.load(slides_file)
 
-    with open(ocr_extracted_file_path, "r", encoding="utf-8") as results_file:
-        results = json.load(results_file)
+    # Copies, so slides shared with other stages are left untouched.
+    all_slides = [
+        dict(slide, cleaned_slide_content=clean_text(slide.get("slideContent", "")))
+        for slide in all_slides
+    ]
 
-    for slide in all_slides:
-        slide["cleaned_slide_content"] = clean_text(slide.get("slideContent", ""))
-
-    for video_id, video_data in results.items():
-        if "extracted_content" in video_data:
-            for timestamp, text_entry in video_data["extracted_content"].items():
-                ocr_text = clean_text(text_entry.get("ocr_slide_content", ""))
-
-                if len(ocr_text) >= 100:
-                    text_entry["sectionId"] = ""
-                    text_entry["sectionUri"] = ""
-                    text_entry["sectionTitle"] = ""
-                    text_entry["slideUri"] =""
-                    text_entry["slideContent"] = ""
-                    text_entry["slideHtml"] = ""
-
-                    best_match = process.extractOne(
-                        ocr_text,
-                        [slide["cleaned_slide_content"] for slide in all_slides],
-                        scorer=fuzz.token_set_ratio,
-                    )
-
-                    if best_match and best_match[1] > 70:
-                        matched_slide = next(
-                            slide
-                            for slide in all_slides
-                            if slide["cleaned_slide_content"] == best_match[0]
-                        )
-
-                        text_entry["sectionId"] = matched_slide["sectionId"]
-                        text_entry["sectionUri"] = matched_slide["sectionUri"]
-                        text_entry["sectionTitle"] = matched_slide["sectionTitle"]
-                        text_entry["slideUri"] = matched_slide["slideUri"]
-                        text_entry["slideContent"] = matched_slide["slideContent"]
-                        text_entry["slideHtml"] = matched_slide["html"]
-
-    with open(updated_extracted_file_path, "w", encoding="utf-8") as output_file:
-        json.dump(results, output_file, indent=4, ensure_ascii=False)
+    # Match state of the last run: the section fingerprints it matched
+    # against and, per entry, the hash of its OCR text and its best score.
+    previous_state = load_json_if_exists(match_state_file_path)
+    previous_entry_states = previous_state.get("entries", {})
+    previous_section_hashes = previous_state.get("section_hashes", {})
+    section_hashes = get_section_hashes(all_slides)
+    changed_sections = {
+        section_id
+        for section_id in set(section_hashes) | set(previous_section_hashes)
+        if section_hashes.get(section_id) != previous_section_hashes.get(section_id)
+    }
+
+    slide_index = SlideIndex(all_slides)
+    changed_slide_index = None
+    if changed_sections:
+        changed_slide_index = SlideIndex(
+            [slide for slide in all_slides if slide["sectionId"] in changed_sections], candidate_count=0
+        )
+
+    previous_clips = ClipLookup(iter_updated_content(course_id, semester_key))
+    if clip_ids is not None and not changed_sections:
+        clip_ids = {str(clip_id) for clip_id in clip_ids}
+        new_clips = ClipLookup(iter_results(course_id, semester_key, clip_ids))
+
+        def clips_to_write():
+            # The other clips keep their entries and match state as they are.
+            for video_id, previous_data in previous_clips.remaining():
+                video_data = new_clips.pop(video_id) if video_id in clip_ids else None
+                yield video_id, video_data, previous_data
+            for video_id, video_data in new_clips.remaining():
+                yield video_id, video_data, None
+    else:
+
+        def clips_to_write():
+            for video_id, video_data in iter_results(course_id, semester_key):
+                yield video_id, video_data, previous_clips.pop(video_id)
+
+    entry_states = {}
+    matched_clip_ids = set()
+    match_counts = [0, 0, 0]
+    changed = not os.path.exists(updated_extracted_file_path)
+    with open_updated_content_writer(course_id, semester_key) as writer:
+        for video_id, video_data, previous_data in clips_to_write():
+            if video_data is None:
+                writer.write(video_id, previous_data)
+                if video_id in previous_entry_states:
+                    entry_states[video_id] = previous_entry_states[video_id]
+                continue
+            clip_states, clip_counts = match_clip(
+                video_data,
+                previous_data,
+                previous_entry_states.get(video_id, {}),
+                changed_sections,
+                slide_index,
+                changed_slide_index,
+            )
+            matched_clip_ids.add(video_id)
+            if clip_states:
+                entry_states[video_id] = clip_states
+            match_counts = [total + count for total, count in zip(match_counts, clip_counts)]
+            changed = changed or video_data != previous_data
+            writer.write(video_id, video_data)
+
+        # Clips dropped from the OCR results also count as a change.
+        changed = changed or next(previous_clips.remaining(), None) is not None
+
+        print(
+            f"{course_id} ({semester_key}): {match_counts[0]} entries matched, "
+            f"{match_counts[1]} rescored against {len(changed_sections)} changed sections, "
+            f"{match_counts[2]} reused"
+        )
+
+        match_state = {"section_hashes": section_hashes, "entries": entry_states}
+        if not changed and match_state == previous_state:
+            writer.discard()
+            print(f"No changes for {updated_extracted_file_path}.")
+            return matched_clip_ids
+
+    write_json_atomic(match_state_file_path, match_state, indent=None)
 
     print(
         f"Slides updated and saved to {updated_extracted_file_path} for course {course_id}!"
     )
+    return matched_clip_ids
 
 
-def main():
-    with open(ALL_COURSES_CLIPS_JSON, "r", encoding="utf-8") as f:
-        all_data = json.load(f)
+def main(all_data=None):
+    if all_data is None:
+        with open(ALL_COURSES_CLIPS_JSON, "r", encoding="utf-8") as f:
+            all_data = json.load(f)
 
     for course_id in COURSE_IDS:
         course_info = all_data.get(course_id, {})
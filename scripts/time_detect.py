@@ -2,51 +2,128 @@ import os
 import json
 from collections import defaultdict
 from config import COURSE_IDS, SLIDES_OUTPUT_DIR, OCR_EXTRACTED_FILE_PATH, ALL_COURSES_CLIPS_JSON
+from result_store import write_json_atomic
+from content_store import (
+    get_updated_content_file,
+    iter_updated_content,
+    open_updated_content_writer,
+    updated_content_exists,
+)
 
 
-def compute_time_per_slide_and_section(course_id,semester_key):
-    input_file = os.path.join(
-        SLIDES_OUTPUT_DIR, f"{course_id}_{semester_key}_updated_extracted_content.json")
-    if not os.path.exists(input_file):
-        print(f"[WARN] File not found: {input_file}")
-        return
+def get_duration_summary_file(course_id, semester_key):
+    return os.path.join(SLIDES_OUTPUT_DIR, f"{course_id}_{semester_key}_durations.json")
+
 
-    with open(input_file, "r", encoding="utf-8") as f:
-        content = json.load(f)
+def load_duration_summary(course_id, semester_key):
+    """Return the persisted per-slide and per-section totals of a course-semester.
 
+    Keys: slide_durations, section_durations and section_slide_durations
+    (seconds, summed over all clips), plus the per-clip shares in "clips".
+    """
+    summary_file = get_duration_summary_file(course_id, semester_key)
+    if not os.path.exists(summary_file):
+        return {"clips": {}, "slide_durations": {}, "section_durations": {}, "section_slide_durations": {}}
+    with open(summary_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def summarize_clip_durations(entries):
+    """Set each entry's duration and return the clip's per-slide and per-section totals."""
     slide_durations = defaultdict(float)
-    section_durations = defaultdict(float)
     section_slide_durations = defaultdict(
         lambda: {"duration": 0.0, "slides": defaultdict(float)})
 
-    for clip_id, clip_data in content.items():
-        entries = clip_data.get("extracted_content", {})
-        for ts, entry in entries.items():
-            start = entry.get("start_time")
-            end = entry.get("end_time")
-            slide = entry.get("slideUri")
-            section = entry.get("sectionUri")
+    for ts, entry in entries.items():
+        start = entry.get("start_time")
+        end = entry.get("end_time")
+        # Unmatched entries (no or an empty slideUri) are summed under "".
+        slide = entry.get("slideUri") or ""
+        section = entry.get("sectionUri")
 
-            if start is None or end is None:
-                continue
+        if start is None or end is None:
+            continue
 
-            duration = float(end) - float(start)
-            entry["duration"] = round(duration, 2)
+        duration = float(end) - float(start)
+        entry["duration"] = round(duration, 2)
+
+        slide_durations[slide] += duration
+        if section:
+            section_slide_durations[section]["duration"] += duration
+            section_slide_durations[section]["slides"][slide] += duration
+
+    return {"slides": slide_durations, "sections": section_slide_durations}
+
+
+def build_duration_totals(clip_summaries):
+    slide_durations = defaultdict(float)
+    section_durations = defaultdict(float)
+    section_slide_durations = defaultdict(
+        lambda: {"duration": 0.0, "slides": defaultdict(float)})
 
+    for clip_summary in clip_summaries.values():
+        for slide, duration in clip_summary["slides"].items():
             slide_durations[slide] += duration
-            if section:
-                section_durations[section] += duration
-                section_slide_durations[section]["duration"] += duration
+        for section, section_summary in clip_summary["sections"].items():
+            section_durations[section] += section_summary["duration"]
+            section_slide_durations[section]["duration"] += section_summary["duration"]
+            for slide, duration in section_summary["slides"].items():
                 section_slide_durations[section]["slides"][slide] += duration
 
-    with open(input_file, "w", encoding="utf-8") as f:
-        json.dump(content, f, indent=2)
+    return {
+        "slide_durations": round_durations(slide_durations),
+        "section_durations": round_durations(section_durations),
+        "section_slide_durations": round_durations(section_slide_durations),
+    }
+
+
+def round_durations(durations):
+    if isinstance(durations, dict):
+        return {key: round_durations(value) for key, value in durations.items()}
+    return round(durations, 2)
+
+
+def compute_time_per_slide_and_section(course_id,semester_key, clip_ids=None):
+    """Fill in entry durations and update the course-semester duration summary.
+
+    With clip_ids, only those clips and clips the summary file has no
+    shares for yet are recomputed; the totals are then rebuilt from the
+    per-clip shares. Clips no longer in the updated file are dropped.
+    """
+    input_file = get_updated_content_file(course_id, semester_key)
+    if not updated_content_exists(course_id, semester_key):
+        print(f"[WARN] File not found: {input_file}")
+        return
+
+    if clip_ids is None:
+        previous_summaries = {}
+    else:
+        clip_ids = {str(clip_id) for clip_id in clip_ids}
+        previous_summaries = load_duration_summary(course_id, semester_key)["clips"]
+
+    # One clip in memory at a time: read it, fill in its durations, write it.
+    clip_summaries = {}
+    with open_updated_content_writer(course_id, semester_key) as writer:
+        for clip_id, clip_data in iter_updated_content(course_id, semester_key):
+            if clip_id in previous_summaries and clip_id not in clip_ids:
+                clip_summaries[clip_id] = previous_summaries[clip_id]
+            else:
+                clip_summaries[clip_id] = round_durations(
+                    summarize_clip_durations(clip_data.get("extracted_content", {}))
+                )
+            writer.write(clip_id, clip_data)
     print(f"[INFO] Updated {input_file} with duration fields.")
 
+    summary = {"clips": clip_summaries, **build_duration_totals(clip_summaries)}
+    summary_file = get_duration_summary_file(course_id, semester_key)
+    write_json_atomic(summary_file, summary, indent=2)
+    print(f"[INFO] Saved slide and section durations to {summary_file}.")
+
 
-def main():
-    with open(ALL_COURSES_CLIPS_JSON, "r", encoding="utf-8") as f:
-        all_data = json.load(f)
+def main(all_data=None):
+    if all_data is None:
+        with open(ALL_COURSES_CLIPS_JSON, "r", encoding="utf-8") as f:
+            all_data = json.load(f)
 
     for course_id in COURSE_IDS:
         course_info = all_data.get(course_id, {})
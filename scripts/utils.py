@@ -1,18 +1,100 @@
 import os
 import json
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 import requests
+from requests.adapters import HTTPAdapter
 import re
 import cv2
-from config import FAU_TV_OEMBED_BASE_URL,FAU_TV_BASE_URL
+from config import (
+    FAU_TV_OEMBED_BASE_URL,
+    FAU_TV_BASE_URL,
+    VIDEO_VALIDATION_MODE,
+    VIDEO_VALIDATION_SAMPLES,
+    DOWNLOAD_CHUNK_SIZE_MB,
+    DOWNLOAD_CHUNK_WORKERS,
+    DOWNLOAD_RETRIES,
+    METADATA_REQUESTS_PER_MINUTE,
+    METADATA_BURST,
+    METADATA_WORKERS,
+    CLIP_INFO_CACHE_FILE,
+    CLIP_INFO_TTL_HOURS,
+    CLIP_INFO_NEGATIVE_TTL_HOURS,
+)
+
+_session = None
+_session_lock = threading.Lock()
 
 def clean_text(text: str) -> str:
     text = re.sub(r"[\u201c\u201d\u2022\u00bb\u2014\u2013]", "", text)
     text = re.sub(r"\s+", " ", text.strip())
     return text
 
-def verify_video_integrity(video_path, full_validation=True):
+def has_complete_mp4_index(video_path):
+    """Walk the top-level MP4 boxes and check that the file is whole.
+
+    A download cut short leaves the last box reaching past the end of the
+    file, and without a moov box the container has no index to seek with.
+    """
+    file_size = os.path.getsize(video_path)
+    found_moov = False
+    offset = 0
+    with open(video_path, "rb") as f:
+        while offset < file_size:
+            f.seek(offset)
+            header = f.read(8)
+            if len(header) < 8:
+                return False
+            box_size, box_type = struct.unpack(">I4s", header)
+            if box_size == 1:
+                large_size = f.read(8)
+                if len(large_size) < 8:
+                    return False
+                box_size = struct.unpack(">Q", large_size)[0]
+            elif box_size == 0:
+                box_size = file_size - offset
+            if box_size < 8:
+                return False
+            if box_type == b"moov":
+                found_moov = True
+            offset += box_size
+    if not found_moov:
+        print(f"No moov atom found: {video_path}")
+    elif offset != file_size:
+        print(f"Container is truncated ({file_size} of {offset} bytes): {video_path}")
+    return found_moov and offset == file_size
+
+
+def verify_sampled_frames(cap, video_path, sample_count=VIDEO_VALIDATION_SAMPLES):
+    total_frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if total_frame_count <= 0:
+        print(f"Video reports no frames: {video_path}")
+        return False
+    for sample_idx in range(sample_count):
+        frame_idx = (total_frame_count - 1) * sample_idx // max(1, sample_count - 1)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        ret, _ = cap.read()
+        if not ret:
+            print(f"OpenCV could not read frame {frame_idx}/{total_frame_count}: {video_path}")
+            return False
+    return True
+
+
+def verify_video_integrity(video_path, full_validation=None, expected_size=None):
+    if full_validation is None:
+        full_validation = VIDEO_VALIDATION_MODE == "full"
     try:
+        if expected_size is not None and os.path.getsize(video_path) != expected_size:
+            print(
+                f"Size mismatch: expected {expected_size} bytes, got {os.path.getsize(video_path)}: {video_path}"
+            )
+            return False
+        if not full_validation and not has_complete_mp4_index(video_path):
+            return False
+
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             print(f"OpenCV cannot open video: {video_path}")
@@ -26,7 +108,12 @@ def verify_video_integrity(video_path, full_validation=True):
 
         print(f"Quick verification passed (first frame readable): {video_path}")
 
-        if full_validation:
+        if not full_validation:
+            if not verify_sampled_frames(cap, video_path):
+                cap.release()
+                return False
+            print(f"Fast validation passed (container index and sampled frames): {video_path}")
+        else:
             print(f"Performing full validation for video: {video_path}")
 
             fps = cap.get(cv2.CAP_PROP_FPS)
@@ -105,10 +192,141 @@ def save_cache(cache, cache_file):
     print(f"Saved cache to {cache_file}")
 
 
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=max(10, DOWNLOAD_CHUNK_WORKERS))
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+    return _session
+
+
 def download_video(url, file_path):
+    """Download url to file_path in parallel byte ranges.
+
+    Completed chunks are recorded in a manifest next to the file, so an
+    interrupted download resumes exactly where it stopped. Servers that
+    reject HEAD, don't report a size or don't accept ranges get a single
+    streamed GET.
+    """
     if not file_path.endswith(".m4v"):
         file_path = f"{file_path}.m4v"
 
+    try:
+        response = get_session().head(url, allow_redirects=True, timeout=30)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as err:
+        # Some servers and CDNs reject HEAD; a plain GET may still work.
+        print(f"HEAD request for {url} failed ({err}), downloading with a single GET.")
+        return download_video_stream(url, file_path)
+    total_size = int(response.headers.get("content-length", 0))
+    if not total_size or response.headers.get("accept-ranges", "").lower() != "bytes":
+        return download_video_stream(url, file_path)
+
+    chunk_size = int(DOWNLOAD_CHUNK_SIZE_MB * 1024 * 1024)
+    chunk_count = -(-total_size // chunk_size)
+    manifest_path = f"{file_path}.manifest.json"
+    done_chunks = load_download_manifest(manifest_path, file_path, url, total_size, chunk_size)
+    pending_chunks = [idx for idx in range(chunk_count) if idx not in done_chunks]
+
+    print(
+        f"Downloading {url} to {file_path} ({total_size // (1024 * 1024)} MB, "
+        f"{len(pending_chunks)}/{chunk_count} chunks left)"
+    )
+    # The manifest goes down before the file is preallocated, so a
+    # full-size file is never mistaken for a finished download.
+    save_download_manifest(manifest_path, url, total_size, chunk_size, done_chunks)
+    with open(file_path, "ab") as f:
+        f.truncate(total_size)
+
+    manifest_lock = threading.Lock()
+    start_time = time.time()
+
+    def fetch_chunk(chunk_idx):
+        chunk_start = chunk_idx * chunk_size
+        chunk_end = min(chunk_start + chunk_size, total_size) - 1
+        for try_idx in range(DOWNLOAD_RETRIES):
+            try:
+                response = get_session().get(
+                    url, headers={"Range": f"bytes={chunk_start}-{chunk_end}"}, timeout=30
+                )
+                response.raise_for_status()
+                if response.status_code != 206 or len(response.content) != chunk_end - chunk_start + 1:
+                    raise ValueError(f"Unexpected response for chunk {chunk_idx}")
+                with open(file_path, "r+b") as f:
+                    f.seek(chunk_start)
+                    f.write(response.content)
+                with manifest_lock:
+                    done_chunks.add(chunk_idx)
+                    save_download_manifest(manifest_path, url, total_size, chunk_size, done_chunks)
+                return len(response.content)
+            except (requests.exceptions.RequestException, ValueError) as err:
+                print(f"Chunk {chunk_idx} of {url} failed (attempt {try_idx + 1}): {err}")
+                time.sleep(2 * try_idx * try_idx)
+        return 0
+
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_CHUNK_WORKERS) as chunk_pool:
+        downloaded_bytes = sum(chunk_pool.map(fetch_chunk, pending_chunks))
+
+    elapsed = max(time.time() - start_time, 1e-6)
+    print(
+        f"Downloaded {downloaded_bytes // (1024 * 1024)} MB in {elapsed:.1f}s "
+        f"({downloaded_bytes / elapsed / (1024 * 1024):.2f} MB/s): {file_path}"
+    )
+    if len(done_chunks) < chunk_count:
+        print(f"Download incomplete, {chunk_count - len(done_chunks)} chunks missing: {file_path}")
+        return None
+
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    print(f"Download completed: {file_path}")
+    return file_path
+
+
+def load_download_manifest(manifest_path, file_path, url, total_size, chunk_size):
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+            if (
+                manifest.get("url") == url
+                and manifest.get("size") == total_size
+                and manifest.get("chunk_size") == chunk_size
+            ):
+                return set(manifest.get("done", []))
+        except json.JSONDecodeError:
+            pass
+        print(f"Discarding stale download manifest: {manifest_path}")
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return set()
+
+    # A shorter file without a manifest was written front to back by a
+    # single streamed download, so every chunk inside it is complete. A
+    # full-size one may be a preallocated file or a download that never got
+    # verified, so it is fetched again rather than trusted.
+    if os.path.exists(file_path):
+        existing_file_size = os.path.getsize(file_path)
+        if existing_file_size < total_size:
+            return set(range(existing_file_size // chunk_size))
+        print(f"Discarding unverified full-size download: {file_path}")
+        os.remove(file_path)
+    return set()
+
+
+def save_download_manifest(manifest_path, url, total_size, chunk_size, done_chunks):
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(
+            {"url": url, "size": total_size, "chunk_size": chunk_size, "done": sorted(done_chunks)},
+            f,
+        )
+    os.replace(tmp_path, manifest_path)
+
+
+def download_video_stream(url, file_path):
     headers = {}
     if os.path.exists(file_path):
         existing_file_size = os.path.getsize(file_path)
@@ -117,7 +335,7 @@ def download_video(url, file_path):
         existing_file_size = 0
 
     try:
-        response = requests.get(url, stream=True, headers=headers, timeout=30)
+        response = get_session().get(url, stream=True, headers=headers, timeout=30)
         response.raise_for_status()
     except requests.exceptions.HTTPError as http_err:
         if response.status_code == 404:
@@ -142,19 +360,164 @@ def download_video(url, file_path):
     return file_path
 
 
-def get_clip_info(clip_id):
+def get_remote_file_size(url):
+    try:
+        response = get_session().head(url, allow_redirects=True, timeout=30)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as err:
+        print(f"Could not get file size for {url}: {err}")
+        return None
+    content_length = response.headers.get("content-length")
+    return int(content_length) if content_length else None
+
+
+def fetch_clip_info(clip_id):
+    """Look up the video link of a clip.
+
+    Returns (url, cacheable): definite answers, including 404s and clips
+    without a link, are cacheable; transient failures are not.
+    """
     try:
         clip_url = f"{FAU_TV_OEMBED_BASE_URL}?url={FAU_TV_BASE_URL}/clip/id/{clip_id}&format=json"
-        response = requests.get(clip_url)
+        response = get_session().get(clip_url, timeout=30)
         response.raise_for_status()
         data = response.json()
         for key in ["presentation_url", "file"]:
             if key in data and data[key]:
-                return data[key]
+                return data[key], True
 
         print(f"No video/audio link found for clip ID: {clip_id}")
-        return None
+        return None, True
 
+    except requests.exceptions.HTTPError as e:
+        print(f"Failed to fetch clip data for clip ID: {clip_id}. Error: {str(e)}")
+        return None, e.response is not None and e.response.status_code == 404
     except requests.exceptions.RequestException as e:
         print(f"Failed to fetch clip data for clip ID: {clip_id}. Error: {str(e)}")
-        return None
+        return None, False
+
+
+def get_clip_info(clip_id):
+    return fetch_clip_info(clip_id)[0]
+
+
+class ClipInfoCache:
+    """On-disk cache of clip video links keyed by clip_id.
+
+    Links expire after CLIP_INFO_TTL_HOURS; clips without a link (404 or no
+    presentation_url) are remembered for CLIP_INFO_NEGATIVE_TTL_HOURS.
+    """
+
+    def __init__(
+        self,
+        cache_file=CLIP_INFO_CACHE_FILE,
+        ttl_hours=CLIP_INFO_TTL_HOURS,
+        negative_ttl_hours=CLIP_INFO_NEGATIVE_TTL_HOURS,
+    ):
+        self.cache_file = cache_file
+        self.ttl = ttl_hours * 3600
+        self.negative_ttl = negative_ttl_hours * 3600
+        self.lock = threading.Lock()
+        try:
+            with open(cache_file, "r") as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def get(self, clip_id):
+        """Return (hit, url) for a clip."""
+        with self.lock:
+            entry = self.entries.get(str(clip_id))
+        if entry is None:
+            return False, None
+        ttl = self.ttl if entry["url"] else self.negative_ttl
+        if time.time() - entry["fetched_at"] > ttl:
+            return False, None
+        return True, entry["url"]
+
+    def put(self, clip_id, url):
+        with self.lock:
+            self.entries[str(clip_id)] = {"url": url, "fetched_at": time.time()}
+            self._save()
+
+    def invalidate(self, clip_id):
+        with self.lock:
+            if self.entries.pop(str(clip_id), None) is not None:
+                self._save()
+
+    def _save(self):
+        tmp_path = f"{self.cache_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=4)
+        os.replace(tmp_path, self.cache_file)
+
+
+class TokenBucket:
+    """Blocking rate limiter allowing `capacity` requests in a burst and
+    `rate_per_minute` requests per minute on average."""
+
+    def __init__(self, rate_per_minute, capacity=1):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            # Taking the token up front (possibly going negative) reserves a
+            # slot, so waiting callers can sleep outside the lock.
+            self.tokens -= 1
+            wait_time = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class ClipInfoFetcher:
+    """Fetches clip presentation URLs in background threads.
+
+    Requests share the pooled session and a token bucket, so prefetching the
+    upcoming clips keeps the rate limit while callers only block when a URL
+    they need hasn't arrived yet. Cached links are returned without using
+    up the rate limit.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute=METADATA_REQUESTS_PER_MINUTE,
+        burst=METADATA_BURST,
+        workers=METADATA_WORKERS,
+    ):
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.cache = ClipInfoCache()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def _fetch(self, clip_id):
+        hit, url = self.cache.get(clip_id)
+        if hit:
+            return url
+        self.bucket.acquire()
+        url, cacheable = fetch_clip_info(clip_id)
+        if cacheable:
+            self.cache.put(clip_id, url)
+        return url
+
+    def prefetch(self, clip_ids):
+        with self.lock:
+            for clip_id in clip_ids:
+                if clip_id not in self.futures:
+                    self.futures[clip_id] = self.pool.submit(self._fetch, clip_id)
+
+    def get(self, clip_id):
+        self.prefetch([clip_id])
+        with self.lock:
+            future = self.futures.pop(clip_id)
+        return future.result()
+
+    def invalidate(self, clip_id):
+        self.cache.invalidate(clip_id)
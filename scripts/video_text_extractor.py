@@ -1,32 +1,107 @@
 import cv2
-import pytesseract
+import numpy as np
+import threading
 import time
 import json
 import datetime
+import multiprocessing
 import os
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
 from rapidfuzz import fuzz
 from utils import (
     download_video,
     load_cache,
     save_cache,
-    get_clip_info,
+    ClipInfoFetcher,
     extract_clip_ids,
     verify_video_integrity,
+    get_remote_file_size,
 )
-from config import OCR_EXTRACTED_FILE_PATH, VIDEO_DOWNLOAD_DIR, FRAME_PROCESSING_SLEEP_TIME, COURSE_IDS
-import time
+from result_store import (
+    append_clip_records,
+    compact_journals,
+    get_journal_file,
+)
+from ocr_backend import get_ocr_backend
+from slide_matcher import match_and_update_extracted_content
+from time_detect import compute_time_per_slide_and_section
+from config import (
+    OCR_EXTRACTED_FILE_PATH,
+    VIDEO_DOWNLOAD_DIR,
+    FRAME_PROCESSING_SLEEP_TIME,
+    FRAME_SAMPLING_MODE,
+    FRAME_SEEK_GRAB_SECONDS,
+    EXTRACTION_WORKERS,
+    DOWNLOAD_WORKERS,
+    SEGMENT_WORKERS,
+    FRAME_DIFF_MODE,
+    FRAME_DIFF_THRESHOLD,
+    FRAME_DIFF_THUMBNAIL_WIDTH,
+    FRAME_DHASH_SIZE,
+    FRAME_DHASH_THRESHOLD,
+    SLIDE_REGION,
+    FRAME_CHANGE_PRECISION,
+    OCR_BATCH_SIZE,
+    VIDEO_SOURCE_MODE,
+    METADATA_PREFETCH,
+    LINK_CLIPS_ON_EXTRACT,
+    LINK_CLIPS_BATCH_SIZE,
+    PROCESS_START_METHOD,
+    COURSE_IDS,
+)
+
+INTERVAL_SECONDS = 10
+SIMILARITY_THRESHOLD = 60
+DHASH_MARGIN = 2
+
+_clip_info_fetcher = None
+_clip_info_fetcher_lock = threading.Lock()
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+
+
+def get_clip_info_fetcher():
+    # One fetcher per process, so the metadata rate limit spans all courses,
+    # including courses the pipeline extracts concurrently.
+    global _clip_info_fetcher
+    with _clip_info_fetcher_lock:
+        if _clip_info_fetcher is None:
+            _clip_info_fetcher = ClipInfoFetcher()
+    return _clip_info_fetcher
+
+
+def create_process_pool(max_workers):
+    # Pools are started while download, metadata and pipeline threads run;
+    # a forked child could inherit a lock one of them holds and deadlock.
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context(PROCESS_START_METHOD)
+    )
+
+
+def submit_extraction(*args):
+    """Run extract_clip(*args) on the extraction pool.
 
-MAX_REQUESTS_PER_MINUTE = 10
-MIN_INTERVAL = 60 / MAX_REQUESTS_PER_MINUTE
-_last_request_time = 0
+    One pool per process, so course-semesters the pipeline extracts
+    concurrently share EXTRACTION_WORKERS processes instead of starting
+    that many each. A pool broken by a crashed worker is replaced.
+    """
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            _extraction_pool = create_process_pool(EXTRACTION_WORKERS)
+        try:
+            return _extraction_pool.submit(extract_clip, *args)
+        except BrokenProcessPool:
+            print("Extraction pool broke, starting a new one.")
+            _extraction_pool = create_process_pool(EXTRACTION_WORKERS)
+            return _extraction_pool.submit(extract_clip, *args)
 
-def throttle():
-    global _last_request_time
-    now = time.time()
-    elapsed = now - _last_request_time
-    if elapsed < MIN_INTERVAL:
-        time.sleep(MIN_INTERVAL - elapsed)
-    _last_request_time = time.time()
 
 def setup_video_capture(video_path):
     cap = cv2.VideoCapture(video_path)
@@ -49,27 +124,82 @@ def crop_frame_to_remove_watermark(frame):
     return cropped_frame
 
 
-def differentiate_frame(last_frame, current_frame):
-    current_gray_frame = cv2.cvtColor(current_frame, cv2.COLOR_BGR2GRAY)
-    if (
-        last_frame is None
-        or cv2.norm(last_frame, current_gray_frame, cv2.NORM_L2) > 4000
-    ):
-        return True, current_gray_frame
-    return False, None
+def crop_frame_to_slide_region(frame):
+    if not SLIDE_REGION:
+        return frame
+    height, width = frame.shape[:2]
+    x0, y0, x1, y1 = SLIDE_REGION
+    return frame[int(y0 * height) : int(y1 * height), int(x0 * width) : int(x1 * width)]
+
 
+def frame_signature(frame):
+    """Reduce a BGR frame to what differentiate_frame compares.
 
-def binary_search_frame_change(cap, start_time, end_time, fps, last_frame):
-    while end_time - start_time > 1 / fps:
+    "thumbnail" and "dhash" work on a small grayscale image of the slide
+    region, so their cost and thresholds do not depend on the video
+    resolution. "l2" keeps the full-resolution grayscale frame.
+    """
+    if FRAME_DIFF_MODE == "l2":
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    region = crop_frame_to_slide_region(frame)
+    if FRAME_DIFF_MODE == "dhash":
+        size = (FRAME_DHASH_SIZE + 1, FRAME_DHASH_SIZE)
+    else:
+        height, width = region.shape[:2]
+        thumbnail_height = max(1, round(FRAME_DIFF_THUMBNAIL_WIDTH * height / width))
+        size = (FRAME_DIFF_THUMBNAIL_WIDTH, thumbnail_height)
+    thumbnail = cv2.cvtColor(
+        cv2.resize(region, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY
+    )
+    if FRAME_DIFF_MODE == "dhash":
+        # Neighbours within a couple of gray levels count as equal, so flat
+        # slide backgrounds don't flip bits on compression noise. Only the
+        # sign of the gradient is kept, so a slide that differs in
+        # brightness alone hashes the same.
+        gradient = thumbnail[:, 1:].astype(np.int16) - thumbnail[:, :-1]
+        return gradient > DHASH_MARGIN
+    return thumbnail
+
+
+def signatures_differ(last_signature, current_signature):
+    if last_signature is None or last_signature.shape != current_signature.shape:
+        return True
+    if FRAME_DIFF_MODE == "l2":
+        return cv2.norm(last_signature, current_signature, cv2.NORM_L2) > 4000
+    if FRAME_DIFF_MODE == "dhash":
+        return np.count_nonzero(last_signature != current_signature) / last_signature.size > FRAME_DHASH_THRESHOLD
+    # Root mean square difference in gray levels per thumbnail pixel.
+    diff = cv2.absdiff(last_signature, current_signature).astype(np.float32)
+    return float(np.sqrt(np.mean(diff * diff))) > FRAME_DIFF_THRESHOLD
+
+
+def differentiate_frame(last_signature, current_frame):
+    current_signature = frame_signature(current_frame)
+    if signatures_differ(last_signature, current_signature):
+        current_gray_frame = cv2.cvtColor(current_frame, cv2.COLOR_BGR2GRAY)
+        return True, current_gray_frame, current_signature
+    return False, None, None
+
+
+def binary_search_frame_change(probe_cap, start_time, end_time, fps, last_frame, precision=FRAME_CHANGE_PRECISION):
+    """Bisect [start_time, end_time] for the slide change, to within precision.
+
+    probe_cap must be a capture of its own: the seeks here would otherwise
+    move the read position of the capture the sampling loop reads from.
+    """
+    if last_frame is None:
+        # Every frame differs from "no frame", so bisecting would only walk
+        # down to start_time.
+        return round(float(start_time), 2)
+    precision = max(precision, 1 / fps)
+    while end_time - start_time > precision:
         mid_time = (start_time + end_time) / 2
-        cap.set(cv2.CAP_PROP_POS_MSEC, mid_time * 1000)
-        ret, frame = cap.read()
+        probe_cap.set(cv2.CAP_PROP_POS_MSEC, mid_time * 1000)
+        ret, frame = probe_cap.read()
         if not ret:
             break
         cropped_frame = crop_frame_to_remove_watermark(frame)
-        is_different, current_gray_frame = differentiate_frame(
-            last_frame, cropped_frame
-        )
+        is_different, _, _ = differentiate_frame(last_frame, cropped_frame)
         if is_different:
             end_time = mid_time
         else:
@@ -114,135 +244,300 @@ def is_text_extension_of_last_slide(
     return similarity > similarity_threshold
 
 
-def save_partial_results(course_id,semester_key,clip_id, extracted_content,video_duration=None):
-    results_file = f"data/cache/{course_id}_{semester_key}_extracted_content.json"
-    if os.path.exists(results_file):
-        with open(results_file, "r") as f:
-            existing_data = json.load(f)
-    else:
-        existing_data = {}
-
-    if clip_id not in existing_data:
-        existing_data[clip_id] = {"extracted_content": {}}
-    if video_duration is not None:
-        if ("duration" not in existing_data[clip_id] or abs(float(existing_data[clip_id]["duration"]) - float(video_duration)) > 0.001):
-            existing_data[clip_id]["duration"] = float(video_duration)
+def save_partial_results(course_id,semester_key,clip_id, extracted_content,video_duration=None, journal_file=None):
+    if journal_file is None:
+        journal_file = get_journal_file(course_id, semester_key, clip_id)
+    append_clip_records(journal_file, clip_id, extracted_content, video_duration)
 
-    existing_extracted_content = existing_data[clip_id]["extracted_content"]
-    new_extracted = {str(k): v for k, v in extracted_content.items()}
-    existing_extracted_content.update(new_extracted)
-    with open(results_file, "w") as f:
-        json.dump(existing_data, f, indent=4, ensure_ascii=False)
 
-
-
-def extract_text_from_video(video_path, course_id, clip_id, start_time=0):
+def extract_text_from_video(video_path, course_id, semester_key, clip_id, start_time=0, journal_file=None, end_time=None):
     cap, fps = setup_video_capture(video_path)
+    probe_cap = cv2.VideoCapture(video_path)
     video_name, processing_datetime = get_video_metadata(video_path)
     text_dict = {}
-    interval_seconds = 10
+    interval_seconds = INTERVAL_SECONDS
     last_frame = None
-    similarity_threshold = 60
+    similarity_threshold = SIMILARITY_THRESHOLD
 
     # Inform the user and seek the video to the correct position if start_time is provided
     if start_time > 0:
         print(f"Seeking video to start time: {start_time} seconds...")
         cap.set(cv2.CAP_PROP_POS_MSEC, start_time * 1000)
+        if end_time is not None:
+            # A segment compares its first sample with the last sample before
+            # the cut, so a slide change there is bisected like any other.
+            last_frame = read_frame_signature_at(probe_cap, start_time - interval_seconds)
 
     text_dict = process_video_frames(
-        cap, fps, interval_seconds, last_frame, similarity_threshold, course_id, clip_id, start_time
+        cap, fps, interval_seconds, last_frame, similarity_threshold, course_id, semester_key, clip_id, start_time, journal_file, end_time, probe_cap
     )
 
     cap.release()
+    probe_cap.release()
     cv2.destroyAllWindows()
 
     return text_dict
 
 
+def read_frame_signature_at(cap, target_time):
+    cap.set(cv2.CAP_PROP_POS_MSEC, max(0, target_time) * 1000)
+    ret, frame = cap.read()
+    if not ret:
+        return None
+    return frame_signature(crop_frame_to_remove_watermark(frame))
+
+
+def split_into_segments(video_duration, segment_count, interval_seconds=INTERVAL_SECONDS):
+    # Cut on the sampling grid so the segments sample the same frames as a
+    # single serial pass would.
+    intervals = -(-video_duration // interval_seconds)
+    per_segment = max(1, -(-intervals // segment_count)) * interval_seconds
+    segments = []
+    segment_start = 0
+    while segment_start < video_duration:
+        segment_end = min(segment_start + per_segment, video_duration)
+        segments.append((segment_start, segment_end))
+        segment_start = segment_end
+    return segments
+
+
+def stitch_segment_results(segment_results, similarity_threshold=SIMILARITY_THRESHOLD, end_time=None):
+    """Concatenate per-segment text dicts in timeline order.
+
+    The first entry of a segment ends the last entry before it, or is
+    merged into it with the same extension rule update_text_dict applies
+    during a serial pass. With end_time, the last entry is extended to it,
+    past any trailing segments without a slide change.
+    """
+    text_dict = {}
+    for segment_dict in segment_results:
+        if not segment_dict:
+            continue
+        first_key = min(segment_dict.keys())
+        first_entry = segment_dict[first_key]
+        if text_dict:
+            last_key = max(text_dict.keys())
+            if is_text_extension_of_last_slide(
+                text_dict[last_key]["ocr_slide_content"],
+                first_entry["ocr_slide_content"],
+                similarity_threshold,
+            ):
+                text_dict[last_key]["end_time"] = first_entry["end_time"]
+                text_dict[last_key]["ocr_slide_content"] = first_entry["ocr_slide_content"]
+                segment_dict = {k: v for k, v in segment_dict.items() if k != first_key}
+            else:
+                text_dict[last_key]["end_time"] = first_entry["start_time"]
+        text_dict.update(segment_dict)
+    if text_dict and end_time is not None:
+        text_dict[max(text_dict.keys())]["end_time"] = end_time
+    return text_dict
+
 
-def process_video_frames(cap, fps, interval_seconds, last_frame, similarity_threshold, course_id, clip_id, start_time):
+def extract_text_from_video_segments(video_path, course_id, semester_key, clip_id, video_duration, segment_count):
+    """Run frame differencing and OCR on segment_count time ranges in parallel.
+
+    Each segment starts from the frame sampled just before its cut, so a
+    segment whose first slide continues from the previous one adds no entry
+    for it.
+    """
+    segments = split_into_segments(video_duration, segment_count)
+    print(f"Splitting clip {clip_id} into {len(segments)} segments")
+    with create_process_pool(len(segments)) as segment_pool:
+        futures = [
+            segment_pool.submit(
+                extract_text_from_video,
+                video_path,
+                course_id,
+                semester_key,
+                clip_id,
+                segment_start,
+                None,
+                segment_end,
+            )
+            for segment_start, segment_end in segments
+        ]
+        segment_results = [future.result() for future in futures]
+    return stitch_segment_results(segment_results, end_time=segments[-1][1])
+
+
+def read_frame_at(cap, fps, target_time, decode_stats):
+    # Short gaps are cheaper to walk with grab() than to seek, because a seek
+    # restarts decoding at the previous keyframe.
+    target_frame = int(round(target_time * fps))
+    current_frame = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+    gap = target_frame - current_frame
+    if 0 <= gap <= FRAME_SEEK_GRAB_SECONDS * fps:
+        for _ in range(gap):
+            if not cap.grab():
+                return False, None
+            decode_stats["grabbed"] += 1
+    else:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, target_frame)
+        decode_stats["seeks"] += 1
+    ret, frame = cap.read()
+    if ret:
+        decode_stats["decoded"] += 1
+    return ret, frame
+
+
+def iter_sampled_frames(cap, fps, interval_seconds, start_time, stop_time, decode_stats):
     next_check_time = start_time
-    text_dict = {}
-    video_duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
-    sleep_time = float(FRAME_PROCESSING_SLEEP_TIME)
+    if FRAME_SAMPLING_MODE == "seek":
+        while cap.isOpened() and next_check_time < stop_time:
+            ret, frame = read_frame_at(cap, fps, next_check_time, decode_stats)
+            if not ret:
+                break
+            yield cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, frame
+            next_check_time += interval_seconds
+        return
 
     while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
+        if not cap.grab():
             break
-
+        decode_stats["grabbed"] += 1
         current_time = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if current_time >= stop_time:
+            break
         if current_time >= next_check_time:
-            text_dict, last_frame = process_single_frame(
-                cap,
-                frame,
-                fps,
-                last_frame,
-                current_time,
-                text_dict,
-                similarity_threshold,
-            )
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            decode_stats["decoded"] += 1
+            yield current_time, frame
             next_check_time += interval_seconds
-            if sleep_time > 0:
-                time.sleep(sleep_time)  # Add delay between frame processing
 
-            # Save partial results
-            save_partial_results(course_id,semester_key, clip_id, text_dict,video_duration)
 
-            # Display progress
-            progress = (current_time / video_duration) * 100
-            print(f"Processing progress: {progress:.2f}%")
+def process_video_frames(cap, fps, interval_seconds, last_frame, similarity_threshold, course_id, semester_key, clip_id, start_time, journal_file=None, end_time=None, probe_cap=None):
+    # With end_time set only that segment of the clip is processed and
+    # nothing is saved; the caller stitches and saves the segments.
+    # probe_cap is a second capture of the same video used to locate slide
+    # changes, so the sampling read position of cap is never disturbed.
+    text_dict = {}
+    video_duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
+    is_segment = end_time is not None
+    stop_time = min(end_time, video_duration) if is_segment else video_duration
+    sleep_time = float(FRAME_PROCESSING_SLEEP_TIME)
+    decode_stats = {"seeks": 0, "grabbed": 0, "decoded": 0}
+    last_extracted_text = ""
+    # Slide changes waiting for OCR, as (change time, frame). Detecting a
+    # change does not need the OCR text, so up to OCR_BATCH_SIZE of them
+    # are recognized together and then applied in order.
+    pending_ocr = []
+
+    for current_time, frame in iter_sampled_frames(
+        cap, fps, interval_seconds, start_time, stop_time, decode_stats
+    ):
+        slide_change, last_frame = detect_slide_change(
+            probe_cap if probe_cap is not None else cap,
+            frame,
+            fps,
+            last_frame,
+            current_time,
+        )
+        if slide_change:
+            pending_ocr.append(slide_change)
+        changed_keys = set()
+        if len(pending_ocr) >= OCR_BATCH_SIZE:
+            last_extracted_text, changed_keys = apply_ocr_batch(
+                pending_ocr, text_dict, last_extracted_text, similarity_threshold
+            )
+            pending_ocr = []
+        if sleep_time > 0:
+            time.sleep(sleep_time)  # Add delay between frame processing
+
+        # Save partial results: every entry the OCR batch touched, or else
+        # the last two entries, which is all a single sample can touch
+        if not is_segment and not pending_ocr:
+            changed_keys = changed_keys or sorted(text_dict)[-2:]
+            changed = {k: text_dict[k] for k in sorted(changed_keys)}
+            save_partial_results(course_id,semester_key, clip_id, changed,video_duration, journal_file)
+
+        # Display progress
+        progress = (current_time / video_duration) * 100
+        print(f"Processing progress: {progress:.2f}%")
+
+    if pending_ocr:
+        last_extracted_text, changed_keys = apply_ocr_batch(
+            pending_ocr, text_dict, last_extracted_text, similarity_threshold
+        )
+        if not is_segment and changed_keys:
+            changed = {k: text_dict[k] for k in sorted(changed_keys)}
+            save_partial_results(course_id,semester_key, clip_id, changed,video_duration, journal_file)
 
     if text_dict:
         last_key = max(text_dict.keys())
-        text_dict[last_key]["end_time"] = video_duration
+        text_dict[last_key]["end_time"] = stop_time
 
+    print(
+        f"Decode stats for clip {clip_id} ({FRAME_SAMPLING_MODE}): "
+        f"{decode_stats['decoded']} decoded, {decode_stats['grabbed']} grabbed, "
+        f"{decode_stats['seeks']} seeks"
+    )
     return text_dict
 
 
-def process_single_frame(
-    cap, frame, fps, last_frame, current_time, text_dict, similarity_threshold
-):
+def detect_slide_change(probe_cap, frame, fps, last_frame, current_time):
+    """Return ((change time, frame to OCR) or None, new last_frame) for a sample.
+
+    last_frame is the frame_signature of the last slide; it only moves on
+    when the slide changes, so each slide image is OCR'd once.
+    """
     current_cropped_frame = crop_frame_to_remove_watermark(frame)
-    if (
-        last_frame is not None and len(last_frame.shape) != 2
-    ):  # for gray scale image dimension is 2
-        last_frame = cv2.cvtColor(last_frame, cv2.COLOR_BGR2GRAY)
-    last_extracted_text = (
-        pytesseract.image_to_string(last_frame).strip()
-        if last_frame is not None
-        else ""
-    )
-    is_different, current_gray_frame = differentiate_frame(
+    is_different, current_gray_frame, current_signature = differentiate_frame(
         last_frame, current_cropped_frame
     )
+    if not is_different:
+        return None, last_frame
 
-    if is_different:
-        exact_frame_change_time = binary_search_frame_change(
-            cap, max(0, current_time - 10), current_time, fps, last_frame
+    exact_frame_change_time = binary_search_frame_change(
+        probe_cap, max(0, current_time - INTERVAL_SECONDS), current_time, fps, last_frame
+    )
+    return (exact_frame_change_time, current_gray_frame), current_signature
+
+
+def apply_ocr_text(text_dict, last_extracted_text, current_frame_extracted_text, exact_frame_change_time, similarity_threshold):
+    # last_extracted_text is the OCR result of the previous slide, carried
+    # over so an extended slide updates its entry instead of adding one.
+    if current_frame_extracted_text:
+        update_text_dict(
+            text_dict,
+            last_extracted_text,
+            current_frame_extracted_text,
+            exact_frame_change_time,
+            similarity_threshold,
         )
-        last_frame = current_gray_frame
-        current_frame_extracted_text = pytesseract.image_to_string(
-            current_gray_frame
-        ).strip()
-
-        if current_frame_extracted_text:
-            update_text_dict(
-                text_dict,
-                last_extracted_text,
-                current_frame_extracted_text,
-                exact_frame_change_time,
-                similarity_threshold,
+        # only for testing purpose
+        output_file_path = "extracted_text_log.txt"
+
+        with open(output_file_path, "a") as log_file:
+            log_file.write(
+                f"Extracted Text at {exact_frame_change_time}s: {current_frame_extracted_text}\n"
             )
-            # only for testing purpose
-            output_file_path = "extracted_text_log.txt"
+    return current_frame_extracted_text
+
 
-            with open(output_file_path, "a") as log_file:
-                log_file.write(
-                    f"Extracted Text at {exact_frame_change_time}s: {current_frame_extracted_text}\n"
-                )
+def apply_ocr_batch(pending_ocr, text_dict, last_extracted_text, similarity_threshold):
+    """OCR a batch of slide changes and apply them in order.
 
-    return text_dict, last_frame
+    Returns the OCR text of the last slide and the keys of the entries the
+    batch added or extended, for the journal.
+    """
+    texts = get_ocr_backend().recognize_batch([gray_frame for _, gray_frame in pending_ocr])
+    changed_keys = set()
+    for (exact_frame_change_time, _), current_frame_extracted_text in zip(pending_ocr, texts):
+        # Applying a text only ever touches the last entry and a new one.
+        if text_dict:
+            changed_keys.add(max(text_dict.keys()))
+        last_extracted_text = apply_ocr_text(
+            text_dict,
+            last_extracted_text,
+            current_frame_extracted_text,
+            exact_frame_change_time,
+            similarity_threshold,
+        )
+        if text_dict:
+            changed_keys.add(max(text_dict.keys()))
+    return last_extracted_text, changed_keys
 
 
 def update_text_dict(
@@ -287,86 +582,235 @@ def is_fully_extracted(cache, clip_id):
     last_end_time = content[last_entry].get("end_time")
     return abs(last_end_time - cached_duration) < 0.5
 
-def process_videos(clip_ids, course_id, semester_key):
+def get_final_video_path(video_dir, clip_id):
+    return os.path.join(video_dir, f"{clip_id}.m4v")
+
+
+def needs_clip_info(clip_id, course_id, video_dir):
+    if os.path.exists(get_final_video_path(video_dir, clip_id)):
+        return False
+    return course_id != "ai-2"
+
+
+def prepare_clip(clip_id, course_id, video_dir):
+    """Resolve, download and verify the video of one clip.
+
+    Returns the local video path, or None if the clip has to be skipped. In
+    "stream" mode nothing is downloaded and the presentation URL itself is
+    returned, for cv2.VideoCapture to read over HTTP.
+    """
+    temp_video_path = os.path.join(video_dir, f"{clip_id}_tmp.m4v")
+    final_video_path = get_final_video_path(video_dir, clip_id)
+
+    if os.path.exists(final_video_path):
+        print(f"Video for clip ID {clip_id} already downloaded. Skipping download.")
+        return final_video_path
+
+    if(course_id=="ai-2"):
+        print("Course ai-2 , skipping download")
+        return None
+
+    slides_and_audio_url = get_clip_info_fetcher().get(clip_id)
+    if not slides_and_audio_url:
+        print(f"No valid link found for clip ID {clip_id}. Skipping.")
+        return None
+
+    if VIDEO_SOURCE_MODE == "stream":
+        print(f"Streaming video for clip ID {clip_id} from {slides_and_audio_url}")
+        return slides_and_audio_url
+    print(f"Downloading video for clip ID: {clip_id}")
+    if not download_video(slides_and_audio_url, temp_video_path):
+        print(f"Failed to download clip ID {clip_id}. Will resume on the next run.")
+        # The cached link may have gone stale; look it up again next time.
+        get_clip_info_fetcher().invalidate(clip_id)
+        return None
+
+    if verify_video_integrity(
+        temp_video_path, expected_size=get_remote_file_size(slides_and_audio_url)
+    ):
+        os.rename(temp_video_path, final_video_path)
+        print(f"Successfully downloaded and verified clip ID {clip_id}.")
+        return final_video_path
+
+    print(f"Failed to verify download for clip ID {clip_id}. Skipping.")
+    if os.path.exists(temp_video_path):
+        os.remove(temp_video_path)
+    return None
+
+
+def extract_clip(course_id, semester_key, clip_id, video_path):
+    """Run OCR on one downloaded clip, appending to the clip's own journal.
+
+    Runs inside a worker process, which owns its cv2.VideoCapture.
+    """
+    journal_file = get_journal_file(course_id, semester_key, clip_id)
+
+    cap, fps = setup_video_capture(video_path)
+    if not cap.isOpened() or not fps:
+        cap.release()
+        raise ValueError(f"OpenCV cannot open video: {video_path}")
+    video_duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
+    cap.release()
+
+    print(f"Processing video for text extraction: {video_path}")
+    if SEGMENT_WORKERS > 1:
+        extracted_content = extract_text_from_video_segments(
+            video_path, course_id, semester_key, clip_id, video_duration, SEGMENT_WORKERS
+        )
+    else:
+        extracted_content = extract_text_from_video(
+            video_path, course_id, semester_key, clip_id, 0, journal_file
+        )
+    save_partial_results(
+        course_id, semester_key, clip_id, extracted_content, video_duration, journal_file
+    )
+    return journal_file
+
+
+def link_clips(course_id, semester_key, clip_ids):
+    """Match extracted clips to slides and fill in their durations, so they
+    are linked to the notes without waiting for the rest of the backlog."""
+    try:
+        # Changed slides make the matcher rematch more than clip_ids; the
+        # durations of every rematched clip have to follow.
+        matched_clip_ids = match_and_update_extracted_content(course_id, semester_key, clip_ids=clip_ids)
+        if matched_clip_ids is None:
+            matched_clip_ids = clip_ids
+        compute_time_per_slide_and_section(course_id, semester_key, clip_ids=matched_clip_ids)
+    except Exception as e:
+        print(f"Linking clip IDs {', '.join(clip_ids)} to slides failed: {e}")
+
+
+def process_videos(clip_ids, course_id, semester_key, on_clips_extracted=None):
+    """OCR the given clips of a course-semester.
+
+    on_clips_extracted(course_id, semester_key, clip_ids) is called on the
+    thread that compacts results, for every LINK_CLIPS_BATCH_SIZE clips
+    whose results are compacted, and for the rest at the end. It defaults to link_clips
+    when LINK_CLIPS_ON_EXTRACT is set; each call rewrites the semester's
+    updated file, hence the batches.
+    """
+    if on_clips_extracted is None and LINK_CLIPS_ON_EXTRACT:
+        on_clips_extracted = link_clips
     video_dir = os.path.join(VIDEO_DOWNLOAD_DIR, course_id, semester_key)
     os.makedirs(video_dir, exist_ok=True)
 
-    results_file = f"data/cache/{course_id}_{semester_key}_extracted_content.json"
-    if os.path.exists(results_file):
-        with open(results_file, "r", encoding='utf-8') as f:
-            cache = json.load(f)
-    else:
-        cache = {}
+    cache = compact_journals(course_id, semester_key)
 
+    pending_clip_ids = []
     for clip_id in clip_ids:
         clip_id = str(clip_id)
         if is_fully_extracted(cache, clip_id):
             print(f"✔ {clip_id} already fully extracted. Skipping.")
-            final_video_path = os.path.join(video_dir, f"{clip_id}.m4v")
+            final_video_path = get_final_video_path(video_dir, clip_id)
             if os.path.exists(final_video_path):
                 os.remove(final_video_path)
             continue
-
-        throttle()
-        slides_and_audio_url = get_clip_info(clip_id)
-
-        if not slides_and_audio_url:
-            print(f"No valid link found for clip ID {clip_id}. Skipping.")
-            continue
-
-        temp_video_path = os.path.join(video_dir, f"{clip_id}_tmp.m4v")
-        final_video_path = os.path.join(video_dir, f"{clip_id}.m4v")
-        
-        if not os.path.exists(final_video_path):
-            if(course_id=="ai-2"):
-                print("Course ai-2 , skipping download")
-                continue
-            print(f"Downloading video for clip ID: {clip_id}")
-            for try_idx in range(10):
+        pending_clip_ids.append(clip_id)
+
+    # Downloads run at most DOWNLOAD_WORKERS at a time and stop getting ahead
+    # of OCR once that many downloaded clips are waiting for a worker, which
+    # bounds the number of videos on disk.
+    # Presentation URLs of the next METADATA_PREFETCH clips that still need a
+    # download are fetched ahead, so prepare_clip rarely waits on the rate
+    # limit.
+    clips_needing_info = [
+        clip_id for clip_id in pending_clip_ids if needs_clip_info(clip_id, course_id, video_dir)
+    ]
+    info_positions = {clip_id: idx for idx, clip_id in enumerate(clips_needing_info)}
+    clip_queue = iter(pending_clip_ids)
+    downloads = {}
+    extractions = {}
+    clips_to_link = []
+    # Finished clips are compacted and linked on a single results thread, so
+    # compaction never replays or deletes journals while a link reads them,
+    # and updates to the updated file stay in order.
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as download_pool, ThreadPoolExecutor(
+        max_workers=1
+    ) as results_pool:
+
+        def finish_clip(clip_id, video_path):
+            try:
+                cache = compact_journals(course_id, semester_key, {clip_id})
+                # In stream mode video_path is the URL and there is no file.
+                if is_fully_extracted(cache, clip_id) and os.path.exists(video_path):
+                    print(f"✔ {clip_id} fully extracted. Deleting video file.")
+                    os.remove(video_path)
+                if on_clips_extracted and clip_id in cache:
+                    clips_to_link.append(clip_id)
+                    if len(clips_to_link) >= LINK_CLIPS_BATCH_SIZE:
+                        link_batch()
+            except Exception as e:
+                print(f"Saving results of clip ID {clip_id} failed: {e}")
+            print(f"Finished processing clip ID {clip_id}.\n")
+
+        def link_batch():
+            if clips_to_link:
+                on_clips_extracted(course_id, semester_key, list(clips_to_link))
+                clips_to_link.clear()
+
+        def schedule_downloads():
+            while (
+                len(downloads) < DOWNLOAD_WORKERS
+                and len(downloads) + len(extractions) < DOWNLOAD_WORKERS + EXTRACTION_WORKERS
+            ):
+                clip_id = next(clip_queue, None)
+                if clip_id is None:
+                    return
+                if clip_id in info_positions:
+                    info_idx = info_positions[clip_id]
+                    get_clip_info_fetcher().prefetch(
+                        clips_needing_info[info_idx : info_idx + METADATA_PREFETCH + 1]
+                    )
+                future = download_pool.submit(prepare_clip, clip_id, course_id, video_dir)
+                downloads[future] = clip_id
+
+        schedule_downloads()
+        while downloads or extractions:
+            done, _ = wait(list(downloads) + list(extractions), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in downloads:
+                    clip_id = downloads.pop(future)
+                    try:
+                        video_path = future.result()
+                    except Exception as e:
+                        print(f"Download failed for clip ID {clip_id}: {e}")
+                        video_path = None
+                    if video_path:
+                        extraction = submit_extraction(course_id, semester_key, clip_id, video_path)
+                        extractions[extraction] = (clip_id, video_path)
+                    continue
+
+                clip_id, video_path = extractions.pop(future)
                 try:
-                    download_video(slides_and_audio_url, temp_video_path)
-                    break
-                except:
-                    print('failed:' + clip_id)
-                    time.sleep(2*try_idx*try_idx)
-
-            if verify_video_integrity(temp_video_path):
-                os.rename(temp_video_path, final_video_path)
-                print(f"Successfully downloaded and verified clip ID {clip_id}.")
-            else:
-                print(f"Failed to verify download for clip ID {clip_id}. Skipping.")
-                if os.path.exists(temp_video_path):
-                    os.remove(temp_video_path)
-                continue
-        else:
-            print(f"Video for clip ID {clip_id} already downloaded. Skipping download.")
-        cap, fps = setup_video_capture(final_video_path)
-        video_duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
-        cap.release()
+                    future.result()
+                except Exception as e:
+                    print(f"Text extraction failed for clip ID {clip_id}: {e}")
+                results_pool.submit(finish_clip, clip_id, video_path)
+            schedule_downloads()
 
-        print(f"Processing video for text extraction: {final_video_path}")
-        extracted_content = extract_text_from_video(final_video_path, course_id, clip_id, 0)
+        results_pool.submit(link_batch)
 
-        save_partial_results(course_id,semester_key, clip_id, extracted_content,video_duration)
-        with open(results_file, "r", encoding='utf-8') as f:
-            cache = json.load(f)
-        if is_fully_extracted(cache, clip_id):
-            print(f"✔ {clip_id} fully extracted. Deleting video file.")
-            if os.path.exists(final_video_path):
-                os.remove(final_video_path)
-        print(f"Finished processing clip ID {clip_id}. Moving to the next clip.\n")
 
+def process_course_videos(course_id, semester_key, semester_info):
+    clips = semester_info.get("clips", [])
+    clip_ids = [clip["clip_id"] for clip in clips]
+    print(f"Processing course: {course_id} ({semester_key}) with {len(clip_ids)} clips")
+    process_videos(clip_ids, course_id,semester_key)
 
-if __name__ == "__main__":
-    all_courses_clips_path = os.path.join(
-    OCR_EXTRACTED_FILE_PATH, "all_courses_clips.json"
-    )
-    with open(all_courses_clips_path, "r", encoding="utf-8") as f:
-        all_data = json.load(f)
+
+def main(all_data=None):
+    if all_data is None:
+        all_courses_clips_path = os.path.join(
+            OCR_EXTRACTED_FILE_PATH, "all_courses_clips.json"
+        )
+        with open(all_courses_clips_path, "r", encoding="utf-8") as f:
+            all_data = json.load(f)
     for course_id in COURSE_IDS:
         course_info = all_data.get(course_id, {})
         for semester_key in course_info:
-            clips = course_info[semester_key].get("clips", [])
-            clip_ids = [clip["clip_id"] for clip in clips]
-            print(f"Processing course: {course_id} ({semester_key}) with {len(clip_ids)} clips")
-            process_videos(clip_ids, course_id,semester_key)
+            process_course_videos(course_id, semester_key, course_info[semester_key])
+
+
+if __name__ == "__main__":
+    main()